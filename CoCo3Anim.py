@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Converts an animated GIF (or any other animated image PIL can read, or a sequence of frame images) into an HSCREEN animation for the CoCo 3.
+
+The frames are read, resized, dithered and packed one at a time, so only a couple of frames are ever held in memory, no matter how long the clip
+is. The clip is read twice: the first time to build one color histogram for the whole clip, which is used to pick a single palette (16 colors
+for HSCREEN 2, and 2 or 4 colors in the other modes) shared by every frame, and the second time to convert the frames.
+
+The first frame is saved as a keyframe, in the same 8kB .BIN files (compressed or not) the still image converter makes. Every frame after that
+is saved as a list of delta records, holding just the runs of bytes that changed since the frame before. The records are packed into small .BIN
+files that LOADM puts in a buffer at DeltaAddr, and a little machine language routine at PlayerAddr copies each run into the right 8kB bank, so the
+CoCo only rewrites the bytes that changed instead of reloading the whole screen for every frame.
+
+A delta record is: the bank number (0-3), the offset in the bank (2 bytes, high byte first), the number of bytes (1-256, with 256 stored as 0),
+and then the bytes themselves. A bank number of 0xFF ends the list.
+
+Usage:
+    python CoCo3Anim.py MYANIM.GIF [-o outdir] [conversion flags, see --help]
+"""
+from PIL import Image, ImageSequence
+import numpy as np
+import os
+import re
+import struct
+import Image2CoCo3_3 as I2C
+import CoCo3Compress
+
+"""
+Useful constants for the delta files
+DeltaAddr is where LOADM puts each delta file, and PlayerAddr is where the machine language player is loaded. The buffer in between them (below
+the $6000-$7FFF window the banks are switched into) limits the size of each delta file to MaxDeltaSize bytes, including the end marker.
+MergeGap is the largest number of unchanged bytes between two changed runs that are simply rewritten, since that is cheaper than the 4 byte
+header of a new record.
+MaxParts is the most delta files an animation can have, since they are numbered with 4 digits (the BASIC program makes the number with
+RIGHT$(STR$(10000+P),4), which would start over at 0000).
+"""
+DeltaAddr = 0x4000
+PlayerAddr = 0x5F00
+MaxDeltaSize = PlayerAddr-DeltaAddr
+RecordHead = 4
+MergeGap = RecordHead
+EndRecord = b"\xff"
+MaxParts = 9999
+
+"""
+The 6809 machine language delta player. It is loaded at PlayerAddr, and run with EXEC after each delta file is loaded.
+         ORCC  #$50      DISABLE INTERRUPTS WHILE THE BANKS ARE SWITCHED
+         LDX   #$4000    POINT TO THE DELTA RECORDS
+LOOP     LDA   ,X+       GET THE BANK NUMBER
+         CMPA  #$FF      END OF THE RECORDS?
+         BEQ   DONE
+         ADDA  #$30      THE SCREEN BANKS START AT $30
+         STA   $FFA3     SWITCH THE BANK INTO $6000-$7FFF
+         LDD   ,X++      GET THE OFFSET IN THE BANK
+         ADDD  #$6000
+         TFR   D,U
+         LDB   ,X+       GET THE NUMBER OF BYTES (0 MEANS 256)
+COPY     LDA   ,X+       COPY THE BYTES TO THE SCREEN
+         STA   ,U+
+         DECB
+         BNE   COPY
+         BRA   LOOP
+DONE     LDA   #123      GO BACK TO ORIGINAL MEM BANK
+         STA   $FFA3
+         ANDCC #$AF      ENABLE INTERRUPTS
+         RTS
+"""
+PlayerCode = bytes([0x1A,0x50,0x8E,0x40,0x00,0xA6,0x80,0x81,0xFF,0x27,0x17,0x8B,0x30,0xB7,0xFF,0xA3,0xEC,0x81,0xC3,0x60,0x00,0x1F,0x03,
+                    0xE6,0x80,0xA6,0x80,0xA7,0xC0,0x5A,0x26,0xF9,0x20,0xE3,0x86,0x7B,0xB7,0xFF,0xA3,0x1C,0xAF,0x39])
+
+"""
+Python list with the lines used in the BASIC CoCo animation program. It loads the keyframe the same way as the still image display program, then
+loads and runs each delta file in turn. Once the name, palette, number of delta files, and loop flag are found, this will be exported into a
+.BAS file.
+"""
+PlayerProg = ["""10 POKE 65497,0'SPEED UP""","""20 CLEAR 200,&H3FFF'PROTECT THE DELTA BUFFER AND PLAYER""",'30 A$="','"',"""40 FOR H=1TO4'LOOP THROUGH 4 KEYFRAME FILES""","""50 POKE &HFFA3,48+H-1'SET MEM BANK FOR APPROPRIATE FILE""","""60 LOADM A$+STR$(H)'LOAD KEYFRAME FILE""",'70 NEXT',"""80 POKE &HFFA3,123'GO BACK TO ORIGINAL MEM BANK""",'90 B$="','"',"""95 LOADM B$+"PLAY"'LOAD THE DELTA PLAYER""","""100 POKE &HE6C6,18:POKE &HE6C7,18'DISABLE HCLS DURING HSCREEN""","""120 FOR S=0TO15'LOOP THROUGH PALETTE SLOTS""","""130 READ C'LOAD COLOR FOR THAT SLOT""","""140 PALETTE S,C'STORE COLOR IN SLOT""",'150 NEXT',"""155 READ N,L'NUMBER OF DELTA FILES, AND 1 TO LOOP""","""160 HSCREEN 2'DISPLAY THE KEYFRAME""","""161 IF N=0 THEN 174'NOTHING TO ANIMATE""","""162 FOR P=1TON'LOOP THROUGH THE DELTA FILES""","""164 LOADM B$+RIGHT$(STR$(10000+P),4)'LOAD DELTA FILE""","""166 EXEC &H5F00'REWRITE THE CHANGED BYTES""","""168 IF INKEY$<>"" THEN 175'EXIT ON KEYPRESS""",'170 NEXT',"""172 IF L=1 THEN 162'START THE ANIMATION OVER""","""174 A$=INKEY$:IF A$="" THEN 174'WAIT FOR KEYPRESS TO EXIT""","""175 RGB:POKE 65496,0'RESET PALETTE, SLOW DOWN AND EXIT""",'180 DATA ']
+
+"""
+This function takes a filename, and returns the key used to sort frame images into order. Every run of digits is compared as a number, so
+"frame2.png" comes before "frame10.png" even though the numbers aren't padded with zeros.
+"""
+def FrameOrder(filename):
+    return [int(i) if i.isdigit() else i for i in re.split(r"(\d+)",filename)]
+
+"""
+This function takes a list of image files, directories, and glob patterns, and yields every frame of every image, in RGB mode, one at a time.
+Animated images give all of their frames, and still images give one frame each, so a directory of numbered frame images works too (in number
+order, see FrameOrder).
+"""
+def AnimationFrames(Inputs):
+    for filename in sorted(I2C.FindImages(Inputs),key=FrameOrder):
+        with Image.open(filename) as image:
+            for frame in ImageSequence.Iterator(image):
+                yield frame.convert("RGB")
+
+"""
+This function takes the list of inputs, and the dictionary of conversion options, and yields every frame fitted onto the screen
+"""
+def FittedFrames(Inputs,Options):
+    CC_Colors = I2C.CCMonitors[Options["Monitor"]][1]
+    for frame in AnimationFrames(Inputs):
+        yield I2C.FitImage(frame,Options["Stretch"],Options["HPos"],Options["VPos"],CC_Colors[Options["BackColor"]],Options["Mode"])
+
+"""
+This function takes the list of inputs, and the dictionary of conversion options, and returns the list of CoCo color numbers for the palette
+shared by the whole clip, picked from the histogram of all of the frames added together
+"""
+def ClipPalette(Inputs,Options):
+    Histogram = None
+    for frame in FittedFrames(Inputs,Options):
+        counts,sums = I2C.ColorHistogram(frame)
+        if Histogram is None:
+            Histogram = (counts,sums)
+        else:
+            Histogram = (Histogram[0]+counts,Histogram[1]+sums)
+    if Histogram is None:
+        raise ValueError("No frames found")
+    return I2C.SelectPalette(Histogram,I2C.CCMonitors[Options["Monitor"]][1],1<<I2C.CCModes[Options["Mode"]][2])
+
+"""
+This function takes the list of inputs, the dictionary of conversion options, and the palette, and yields the screen data for each
+frame as a numpy array of bytes
+"""
+def PackedFrames(Inputs,Options,CCPal):
+    CC_Colors = I2C.CCMonitors[Options["Monitor"]][1]
+    for frame in FittedFrames(Inputs,Options):
+        imagep,Null = I2C.QuantizeImage(frame,CC_Colors,Options["Dither"],Options["Serpentine"],CCPal)
+        yield np.frombuffer(I2C.EncodeScreen(imagep,CC_Colors,Options["Mode"],CCPal)[0],dtype=np.uint8)
+
+"""
+This function takes the screen data of the previous frame and of the current frame, and returns the list of delta records (as bytes) that turn
+the previous frame into the current one
+"""
+def DeltaRecords(prev,cur):
+    changed = np.flatnonzero(prev!=cur)
+    if len(changed)==0:
+        return []
+    #start a new run wherever the gap since the last changed byte is too big to rewrite, or where a new bank starts
+    breaks = np.flatnonzero((np.diff(changed)>MergeGap+1)|(np.diff(changed//I2C.LImagefileMax)!=0))
+    starts = np.concatenate(([changed[0]],changed[breaks+1]))
+    ends = np.concatenate((changed[breaks],[changed[-1]]))+1
+    records = []
+    for start,end in zip(starts.tolist(),ends.tolist()):
+        for i in range(start,end,256): #one record holds at most 256 bytes
+            n = min(256,end-i)
+            bank,offset = divmod(i,I2C.LImagefileMax)
+            records.append(struct.pack(">BHB",bank,offset,n&0xFF)+cur[i:i+n].tobytes())
+    return records
+
+"""
+This function is a python copy of the machine language player, used to check delta files. It takes the screen data (a writable numpy array of
+bytes), and the data of one delta file, and applies the delta records to the screen data.
+"""
+def ApplyDelta(screen,delta):
+    i = 0
+    while delta[i]!=0xFF:
+        bank,offset,n = struct.unpack(">BHB",delta[i:i+RecordHead])
+        n = n or 256
+        start = bank*I2C.LImagefileMax+offset
+        screen[start:start+n] = np.frombuffer(delta[i+RecordHead:i+RecordHead+n],dtype=np.uint8)
+        i += RecordHead+n
+
+"""
+This function takes some data, and the address to load it at, and returns a CoCo .BIN file image (LOADM format) holding the data
+"""
+def BINFile(data,addr):
+    return b"\x00"+struct.pack(">HH",len(data),addr)+data+I2C.ImagefileFoot
+
+"""
+This function takes the name used for the keyframe .BIN files (truncname), the name used for the delta files (deltaname), the list of CoCo color
+numbers for the palette, the number of delta files, whether to loop, the monitor type, the HSCREEN mode number, and whether the keyframe files
+are compressed, and returns the text of the BASIC animation program
+"""
+def MakePlayerProgram(truncname,deltaname,CCPal,Parts,Loop,Monitor,Mode=2,Compress=0):
+    PalStr = str(CCPal[:1<<I2C.CCModes[Mode][2]])[1:-1]
+    BASText = ""
+    for line in PlayerProg:
+        if line=='30 A$="':
+            line+=truncname
+        elif line=='90 B$="':
+            line+=deltaname
+        elif line=='180 DATA ':
+            line+=PalStr+", "+str(Parts)+", "+str(int(Loop))+'\r'
+        elif line.startswith('175 RGB'):
+            line=line.replace('RGB',I2C.CCMonitors[Monitor][2],1)+'\r'
+        elif Compress==1: #the unpacker is loaded where the player goes, but the player is only loaded after the keyframe
+            line=CoCo3Compress.LoaderLine(I2C.ModeLine(line,Mode))+'\r'
+        else:
+            line=I2C.ModeLine(line,Mode)+'\r'
+        BASText+=line
+    return BASText
+
+"""
+This function converts an animation. It takes the list of inputs, the output directory, the dictionary of conversion options, and whether the
+animation should loop (if it does, one more delta is added to go from the last frame back to the first). It writes the keyframe .BIN files, the
+delta .BIN files, the player .BIN file, and the .BAS program, and returns a dictionary with the number of frames, the number of delta files,
+the total size of the delta data, and the size those deltas would have been as full screens. It raises ValueError if the animation needs more
+than MaxParts delta files.
+"""
+def ConvertAnimation(Inputs,outdir,Options,Loop=True):
+    name,truncname = I2C.FileNames(min(I2C.FindImages(Inputs),key=FrameOrder))
+    deltaname = name[:4] #leaves room for the 4 digit delta file number in the 8 character DECB filename
+    CCPal = ClipPalette(Inputs,Options)
+    os.makedirs(outdir,exist_ok=True)
+    Stats = {"Frames":0,"Parts":0,"DeltaBytes":0,"FullBytes":0}
+    part = b"" #the delta file being built
+    """
+    This function writes the delta file being built (if it holds anything), and starts a new one
+    """
+    def WritePart():
+        nonlocal part
+        if part:
+            if Stats["Parts"]==MaxParts:
+                raise ValueError("The animation needs more than %d delta files, which is too many for the player to load (try fewer frames)" % MaxParts)
+            Stats["Parts"]+=1
+            Stats["DeltaBytes"]+=len(part)+len(EndRecord)
+            with open(os.path.join(outdir,deltaname+"%04d.BIN" % Stats["Parts"]),'wb') as outfile:
+                outfile.write(BINFile(part+EndRecord,DeltaAddr))
+            part = b""
+    """
+    This function adds the delta records that turn one frame into the next, then ends the delta file so each frame is shown before the next one
+    starts loading
+    """
+    def AddFrame(prev,cur):
+        nonlocal part
+        Stats["FullBytes"]+=len(cur)
+        for record in DeltaRecords(prev,cur):
+            if len(part)+len(record)+len(EndRecord)>MaxDeltaSize:
+                WritePart()
+            part+=record
+        WritePart()
+    first = prev = None
+    for cur in PackedFrames(Inputs,Options,CCPal):
+        Stats["Frames"]+=1
+        if prev is None:
+            first = cur
+            for i,fileImage in enumerate(I2C.MakeBINFiles(cur.tobytes(),Options["Compress"])):
+                with open(os.path.join(outdir,truncname+" "+str(i+1)+".BIN"),'wb') as outfile:
+                    outfile.write(fileImage)
+        else:
+            AddFrame(prev,cur)
+        prev = cur
+    if Loop and Stats["Frames"]>1:
+        AddFrame(prev,first)
+    with open(os.path.join(outdir,deltaname+"PLAY.BIN"),'wb') as outfile:
+        outfile.write(BINFile(PlayerCode,PlayerAddr))
+    with open(os.path.join(outdir,name+".BAS"),'w+',newline='') as outfile:
+        outfile.write(MakePlayerProgram(truncname,deltaname,CCPal,Stats["Parts"],Loop,Options["Monitor"],Options["Mode"],Options["Compress"]))
+    return Stats
+
+if __name__ == "__main__":
+    parser = I2C.ConversionParser("Convert an animated image or a sequence of frames to a CoCo 3 HSCREEN animation.")
+    parser.add_argument("inputs",nargs="+",help="animated image file, or frame image files, directories, or glob patterns (in number order)")
+    parser.add_argument("-o","--outdir",default=".",help="directory to write the .BIN and .BAS files to [default: current directory]")
+    parser.add_argument("--no-loop",dest="loop",action="store_false",help="play the animation once instead of looping it")
+    args = parser.parse_args()
+    try:
+        Options = I2C.BatchOptions(args)
+    except (OSError,ValueError,KeyError) as err:
+        parser.error(str(err))
+    if not I2C.FindImages(args.inputs):
+        parser.error("no image files found")
+    try:
+        Stats = ConvertAnimation(args.inputs,args.outdir,Options,args.loop)
+    except ValueError as err:
+        parser.error(str(err))
+    print("%d frames, %d delta files, %d bytes of deltas instead of %d bytes of full frames (%.1f%%)" % (Stats["Frames"],Stats["Parts"],Stats["DeltaBytes"],Stats["FullBytes"],100.0*Stats["DeltaBytes"]/max(1,Stats["FullBytes"])))
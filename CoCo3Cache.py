@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Content addressed cache for converted images. Each entry is keyed by a hash of the source image file's bytes plus all of the conversion options,
+and holds the packed screen data and the palette slots, so a cache hit can skip straight to writing the .BIN and .BAS files.
+
+Every entry is its own file in the cache directory. Entries are written to a temporary name and then renamed, so a reader never sees half an
+entry. The time an entry was last used is kept as its file modification time, and when the cache grows past its size limit, the least recently
+used entries are deleted, down to LowWater of the limit, so the entries only have to be listed once in a while. The running totals (hits,
+misses, stores, evictions, and the total size of the entries) are kept in a small JSON file. Changes to that file, and evictions, happen while
+holding a lock on the lock file, so many batch worker processes can share one cache. Lookups don't take the lock at all: each process counts
+its own hits and misses, and adds them to the file now and then (see FlushStats).
+"""
+import contextlib
+import hashlib
+import json
+import multiprocessing.util
+import os
+import tempfile
+try:
+    import fcntl
+except ImportError: #Windows
+    fcntl = None
+    import msvcrt
+
+"""
+Useful constants for the cache
+CacheVersion is part of every key, so changing it (when the conversion itself changes) makes all of the old entries miss.
+DefaultCacheSize is the default size limit of the cache in bytes. LowWater is the fraction of the size limit the cache is cut down to when it
+goes over. FlushEvery is how many lookups a process counts before it adds its hits and misses to the stats file.
+"""
+CacheVersion = 2
+DefaultCacheSize = 256*1024*1024
+LowWater = 0.9
+FlushEvery = 64
+DefaultCacheDir = os.path.join(os.environ.get("IMAGE2COCO3_CACHE",os.path.join(os.path.expanduser("~"),".cache","Image2CoCo3")),"conversions")
+StatsFile = "stats.json"
+LockFile = "lock"
+EntryExt = ".ent"
+StatNames = ["Hits","Misses","Stores","Evictions","Bytes"]
+
+"""
+The hits and misses counted by this process that aren't in the stats file yet. The keys are 2-tuples of the process ID and the cache directory,
+so a worker process forked from this one doesn't add the counts it was copied with a second time.
+"""
+PendingStats = {}
+
+"""
+This function takes the bytes of the source image file, and the dictionary of conversion options, and returns the cache key as a hex string
+"""
+def CacheKey(data,Options):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([CacheVersion,Options],sort_keys=True).encode("utf-8"))
+    digest.update(data)
+    return digest.hexdigest()
+
+"""
+This function takes the cache directory and a key, and returns the path of the entry file. Entries are spread over 256 subdirectories.
+"""
+def EntryPath(CacheDir,key):
+    return os.path.join(CacheDir,key[:2],key+EntryExt)
+
+"""
+This context manager holds an exclusive lock on the cache directory's lock file while the block inside it runs
+"""
+@contextlib.contextmanager
+def CacheLock(CacheDir):
+    os.makedirs(CacheDir,exist_ok=True)
+    with open(os.path.join(CacheDir,LockFile),"a+b") as lockfile:
+        if fcntl:
+            fcntl.flock(lockfile.fileno(),fcntl.LOCK_EX)
+        else:
+            lockfile.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lockfile.fileno(),msvcrt.LK_LOCK,1)
+                    break
+                except OSError: #LK_LOCK gives up after 10 seconds, so just keep trying
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lockfile.fileno(),fcntl.LOCK_UN)
+            else:
+                lockfile.seek(0)
+                msvcrt.locking(lockfile.fileno(),msvcrt.LK_UNLCK,1)
+
+"""
+This function takes the cache directory, and returns the dictionary of running totals (see StatNames). Hits and misses that running processes
+haven't flushed yet are not counted.
+"""
+def CacheStats(CacheDir):
+    try:
+        with open(os.path.join(CacheDir,StatsFile)) as infile:
+            Stats = json.load(infile)
+    except (OSError,ValueError):
+        Stats = {}
+    return {i:Stats.get(i,0) for i in StatNames}
+
+"""
+This function adds to the running totals. It must be called while holding the cache lock.
+"""
+def AddStats(CacheDir,**changes):
+    Stats = CacheStats(CacheDir)
+    for name,value in changes.items():
+        Stats[name]+=value
+    with tempfile.NamedTemporaryFile("w",dir=CacheDir,suffix=".tmp",delete=False) as outfile:
+        json.dump(Stats,outfile)
+    os.replace(outfile.name,os.path.join(CacheDir,StatsFile))
+    return Stats
+
+"""
+This function takes the cache directory, and returns the dictionary of the hits and misses this process has counted but not added to the
+stats file yet, setting them back to zero. The first time it is used for a directory, FlushStats is set to run when the process exits
+(multiprocessing finalizers run in pool worker processes too, where atexit functions don't).
+"""
+def TakePending(CacheDir):
+    key = (os.getpid(),CacheDir)
+    if key not in PendingStats:
+        PendingStats[key] = {"Hits":0,"Misses":0}
+        multiprocessing.util.Finalize(None,FlushStats,args=(CacheDir,),exitpriority=0)
+    Pending = dict(PendingStats[key])
+    PendingStats[key] = {"Hits":0,"Misses":0}
+    return Pending
+
+"""
+This function adds the hits and misses this process has counted to the stats file of the cache directory
+"""
+def FlushStats(CacheDir):
+    Pending = TakePending(CacheDir)
+    if Pending["Hits"] or Pending["Misses"]:
+        with CacheLock(CacheDir):
+            AddStats(CacheDir,**Pending)
+
+"""
+This function counts a lookup in the cache directory as a hit (if hit is True) or a miss. Every FlushEvery lookups, the counts are added to
+the stats file.
+"""
+def CountLookup(CacheDir,hit):
+    Pending = TakePending(CacheDir)
+    Pending["Hits" if hit else "Misses"]+=1
+    if Pending["Hits"]+Pending["Misses"]>=FlushEvery:
+        with CacheLock(CacheDir):
+            AddStats(CacheDir,**Pending)
+    else:
+        PendingStats[(os.getpid(),CacheDir)] = Pending
+
+"""
+This function takes the cache directory and a key, and returns a 2-tuple of the screen data and the list of palette slot colors if the entry is
+in the cache, or None if it isn't. A hit marks the entry as the most recently used.
+"""
+def CacheGet(CacheDir,key):
+    path = EntryPath(CacheDir,key)
+    try:
+        with open(path,'rb') as infile:
+            data = infile.read()
+        os.utime(path) #the modification time is the last time the entry was used
+    except OSError: #not there, or evicted by another process while it was being read
+        data = None
+    CountLookup(CacheDir,data is not None)
+    if data is None:
+        return None
+    #an entry is the number of palette slots, the palette slots, and then the screen data
+    return data[1+data[0]:],list(data[1:1+data[0]])
+
+"""
+This function stores an entry in the cache. It takes the cache directory, the key, the screen data, the list of palette slot colors, and the size
+limit of the cache in bytes. If the cache is then bigger than the limit, the least recently used entries are deleted until it is down to LowWater
+of the limit. The hits and misses this process has counted are added to the stats file at the same time, since it is being changed anyway.
+"""
+def CachePut(CacheDir,key,ImageContent,CCPal,MaxBytes=DefaultCacheSize):
+    path = EntryPath(CacheDir,key)
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    data = bytes([len(CCPal)])+bytes(CCPal)+ImageContent
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path),suffix=".tmp",delete=False) as outfile:
+        outfile.write(data)
+    with CacheLock(CacheDir):
+        new = not os.path.exists(path)
+        os.replace(outfile.name,path)
+        Stats = AddStats(CacheDir,Stores=1,Bytes=len(data) if new else 0,**TakePending(CacheDir))
+        if Stats["Bytes"]>MaxBytes:
+            Evict(CacheDir,int(MaxBytes*LowWater))
+
+"""
+This function deletes the least recently used entries until the cache is no bigger than MaxBytes. It must be called while holding the cache lock.
+The total size is worked out again from the entry files, so it can't drift from what is actually on disk.
+"""
+def Evict(CacheDir,MaxBytes):
+    entries = []
+    for subdir in os.listdir(CacheDir):
+        if len(subdir)==2 and os.path.isdir(os.path.join(CacheDir,subdir)):
+            for filename in os.listdir(os.path.join(CacheDir,subdir)):
+                if filename.endswith(EntryExt):
+                    path = os.path.join(CacheDir,subdir,filename)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((info.st_mtime,info.st_size,path))
+    entries.sort()
+    total = sum(i[1] for i in entries)
+    evicted = 0
+    for mtime,size,path in entries:
+        if total<=MaxBytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total-=size
+        evicted+=1
+    Stats = CacheStats(CacheDir)
+    AddStats(CacheDir,Evictions=evicted,Bytes=total-Stats["Bytes"])
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Compressed .BIN files for the CoCo 3 image converter. Reading the floppy disk is by far the slowest part of showing an image, so each 8kB bank of
+the screen can be stored compressed, and unpacked into the bank by a small machine language routine after it is loaded.
+
+The compression is a simple LZ77 scheme that the 6809 can unpack in a couple of tight loops. The packed data is a list of tokens, and each one
+starts with a control byte:
+    0x00-0x7F   copy the next (control+1) bytes (1-128 literal bytes)
+    0x80-0xFF   copy (control-0x80+MinMatch) bytes (4-131) from earlier in the bank, starting the number of bytes back given by the next 2 bytes
+                (high byte first)
+There is no end marker, the unpacker just stops when the bank is full. A run of one color is a copy from 1 byte back, so flat areas pack as well as
+they would with run length encoding, and the repeating patterns dithering makes are found too.
+
+Each compressed .BIN file holds two parts: the unpacker at UnpackAddr, and the packed bank at PackAddr, with the unpacker as its EXEC address.
+The .BAS program switches the bank in at $6000, does LOADM and then EXEC, just like it loaded the plain files before. If a bank doesn't pack small
+enough to fit in the buffer below the unpacker, it is stored as is, loading straight into $6000, with the EXEC address pointing at the RTS at the
+end of the unpacker so the same EXEC does nothing.
+"""
+import struct
+
+"""
+Useful constants for the compressed files
+PackAddr is where LOADM puts the packed bank, and UnpackAddr is where the unpacker goes, which limits a packed bank to MaxPackedSize bytes.
+BankAddr and BankSize are where the screen banks are switched in, and how big they are. MinMatch and MaxMatch are the shortest and longest copies
+from earlier in the bank, MaxLiteral is the longest run of literal bytes, and ChainLength is how many earlier places with the same first
+MinMatch bytes are checked for the longest copy.
+"""
+PackAddr = 0x4000
+UnpackAddr = 0x5F00
+MaxPackedSize = UnpackAddr-PackAddr
+BankAddr = 0x6000
+BankSize = 8192
+MinMatch = 4
+MaxMatch = 0x7F+MinMatch
+MaxLiteral = 0x80
+ChainLength = 16
+
+"""
+Load time estimate constants. SectorTime is about how long LOADM takes to read one 256 byte sector from a floppy disk (about 5.6kB/s), and
+CPUHz is the CPU speed while the .BAS program runs (it uses the double speed POKE). The unpacker takes about CopyCycles for each byte it writes,
+plus LiteralCycles or MatchCycles for each token.
+"""
+SectorSize = 256
+SectorTime = 0.045
+CPUHz = 1789773
+CopyCycles = 17
+LiteralCycles = 22
+MatchCycles = 57
+
+"""
+The 6809 machine language unpacker. It is loaded at UnpackAddr with every compressed bank, and run with EXEC once the bank is loaded.
+         LDX   #$4000    POINT TO THE PACKED DATA
+         LDY   #$6000    POINT TO THE START OF THE BANK
+LOOP     CMPY  #$8000    IS THE BANK FULL?
+         BHS   DONE
+         LDB   ,X+       GET THE CONTROL BYTE
+         BMI   MATCH
+         INCB            B = NUMBER OF LITERAL BYTES
+LIT      LDA   ,X+       COPY THEM
+         STA   ,Y+
+         DECB
+         BNE   LIT
+         BRA   LOOP
+MATCH    ANDB  #$7F
+         ADDB  #4        B = NUMBER OF BYTES TO COPY
+         PSHS  B
+         TFR   Y,D       U = WHERE TO COPY THEM FROM
+         SUBD  ,X++
+         TFR   D,U
+         PULS  B
+COPY     LDA   ,U+       COPY THEM ONE AT A TIME, SO A COPY CAN OVERLAP ITSELF
+         STA   ,Y+
+         DECB
+         BNE   COPY
+         BRA   LOOP
+DONE     RTS
+"""
+UnpackCode = bytes([0x8E,0x40,0x00,0x10,0x8E,0x60,0x00,0x10,0x8C,0x80,0x00,0x24,0x25,0xE6,0x80,0x2B,0x0A,0x5C,0xA6,0x80,0xA7,0xA0,0x5A,0x26,0xF9,
+                    0x20,0xEC,0xC4,0x7F,0xCB,MinMatch,0x34,0x04,0x1F,0x20,0xA3,0x81,0x1F,0x03,0x35,0x04,0xA6,0xC0,0xA7,0xA0,0x5A,0x26,0xF9,0x20,0xD5,
+                    0x39])
+ReturnAddr = UnpackAddr+len(UnpackCode)-1 #the RTS at the end of the unpacker
+
+"""
+This function takes the data, and the two places in it that are being compared (i, and the earlier place j), and returns how many bytes match
+starting at those places (at most MaxMatch). The first MinMatch bytes are already known to match. It is a binary search on slices, so the bytes
+are compared in C instead of one at a time in python.
+"""
+def MatchLength(data,i,j):
+    lo,hi = MinMatch,min(MaxMatch,len(data)-i)
+    while lo<hi:
+        mid = (lo+hi+1)//2
+        if data[i:i+mid]==data[j:j+mid]:
+            lo = mid
+        else:
+            hi = mid-1
+    return lo
+
+"""
+This function takes the data of one bank, and returns it packed (see the description at the top of this file). Each place in the data is
+matched against the places before it that start with the same MinMatch bytes, and the longest copy is used (greedy parsing).
+"""
+def Pack(data):
+    data = bytes(data)
+    out = bytearray()
+    literals = bytearray()
+    chains = {} #the first MinMatch bytes at a place -> the most recent places that start with them
+    def Remember(i):
+        chain = chains.setdefault(data[i:i+MinMatch],[])
+        chain.append(i)
+        if len(chain)>ChainLength:
+            del chain[0]
+    def FlushLiterals():
+        for k in range(0,len(literals),MaxLiteral):
+            chunk = literals[k:k+MaxLiteral]
+            out.append(len(chunk)-1)
+            out.extend(chunk)
+        literals.clear()
+    i = 0
+    while i<len(data):
+        length,offset = 0,0
+        if i+MinMatch<=len(data):
+            for j in reversed(chains.get(data[i:i+MinMatch],())):
+                n = MatchLength(data,i,j)
+                if n>length:
+                    length,offset = n,i-j
+                    if n==MaxMatch:
+                        break
+        if length>=MinMatch:
+            FlushLiterals()
+            out.append(0x80+length-MinMatch)
+            out.extend(struct.pack(">H",offset))
+            for k in range(i,min(i+length,len(data)-MinMatch+1)):
+                Remember(k)
+            i += length
+        else:
+            literals.append(data[i])
+            if i+MinMatch<=len(data):
+                Remember(i)
+            i += 1
+    FlushLiterals()
+    return bytes(out)
+
+"""
+This function is a python copy of the machine language unpacker, used to check packed banks. It takes the packed data, and returns the unpacked
+bank (Size bytes).
+"""
+def Unpack(packed,Size=BankSize):
+    out = bytearray()
+    i = 0
+    while len(out)<Size:
+        control = packed[i]
+        if control<0x80:
+            out += packed[i+1:i+2+control]
+            i += 2+control
+        else:
+            start = len(out)-struct.unpack(">H",packed[i+1:i+3])[0]
+            for k in range(control-0x80+MinMatch): #one byte at a time, like the 6809 does, so a copy can overlap itself
+                out.append(out[start+k])
+            i += 3
+    return bytes(out[:Size])
+
+"""
+This function takes packed data, and returns about how many CPU cycles the 6809 unpacker takes to unpack it
+"""
+def UnpackCycles(packed,Size=BankSize):
+    cycles = CopyCycles*Size
+    i = 0
+    while i<len(packed):
+        if packed[i]<0x80:
+            cycles += LiteralCycles
+            i += 2+packed[i]
+        else:
+            cycles += MatchCycles
+            i += 3
+    return cycles
+
+"""
+This function takes a list of 2-tuples of (load address, data), and the EXEC address, and returns a CoCo .BIN file image (LOADM format) that
+loads every one of them
+"""
+def BINFile(Segments,Exec=0):
+    return b"".join(b"\x00"+struct.pack(">HH",len(data),addr)+data for addr,data in Segments)+b"\xff\x00\x00"+struct.pack(">H",Exec)
+
+"""
+This function takes a CoCo .BIN file image, and returns a 2-tuple of the list of (load address, data) segments in it, and its EXEC address
+"""
+def ReadBINFile(fileImage):
+    Segments = []
+    i = 0
+    while fileImage[i]==0x00:
+        length,addr = struct.unpack(">HH",fileImage[i+1:i+5])
+        Segments.append((addr,fileImage[i+5:i+5+length]))
+        i += 5+length
+    return Segments,struct.unpack(">H",fileImage[i+3:i+5])[0]
+
+"""
+This function takes the data of one bank, and returns the .BIN file image for it: packed with the unpacker if that fits in the buffer, and the
+plain bank (with the unpacker, and the RTS as the EXEC address) if it doesn't
+"""
+def PackedBINFile(bank):
+    packed = Pack(bank)
+    if len(packed)<=MaxPackedSize:
+        return BINFile([(UnpackAddr,UnpackCode),(PackAddr,packed)],UnpackAddr)
+    return BINFile([(UnpackAddr,UnpackCode),(BankAddr,bytes(bank))],ReturnAddr)
+
+"""
+This function takes a .BIN file image for one bank (compressed or not), and returns the bank data the CoCo ends up with after LOADM and EXEC
+"""
+def BankData(fileImage):
+    Segments,Exec = ReadBINFile(fileImage)
+    Segments = dict(Segments)
+    if Exec==UnpackAddr:
+        return Unpack(Segments[PackAddr])
+    return Segments[BankAddr]
+
+"""
+This function takes a .BIN file image for one bank (compressed or not), and returns about how many seconds the CoCo takes to LOADM it from a
+floppy disk and unpack it
+"""
+def LoadTime(fileImage):
+    seconds = -(-len(fileImage)//SectorSize)*SectorTime
+    Segments,Exec = ReadBINFile(fileImage)
+    if Exec==UnpackAddr:
+        seconds += UnpackCycles(dict(Segments)[PackAddr])/CPUHz
+    return seconds
+
+"""
+This function takes a line of a .BAS program that loads plain .BIN files into the screen banks, and returns it changed to load compressed ones:
+the memory below the unpacker is kept free for it, and every LOADM of a bank is followed by EXEC to unpack it
+"""
+def LoaderLine(line):
+    if line.startswith("20 CLEAR 200,&H6000"):
+        return "20 CLEAR 200,&H3FFF'PROTECT THE UNPACK BUFFER"
+    return line.replace("LOADM A$+STR$(H)'LOAD","LOADM A$+STR$(H):EXEC'LOAD AND UNPACK")
+
+"""
+This function takes the list of compressed .BIN file images for an image, and returns a dictionary with the size they would have been as plain
+.BIN files, their size, the ratio between the two, and the estimated load times of the plain and the compressed files, in seconds
+"""
+def CompressionReport(fileImages):
+    PlainFile = BINFile([(BankAddr,bytes(BankSize))]) #the same size as a plain .BIN file for one bank
+    Report = {"PlainBytes":len(fileImages)*len(PlainFile),"PackedBytes":sum(len(i) for i in fileImages)}
+    Report["Ratio"] = Report["PackedBytes"]/Report["PlainBytes"]
+    Report["PlainSeconds"] = len(fileImages)*LoadTime(PlainFile)
+    Report["PackedSeconds"] = sum(LoadTime(i) for i in fileImages)
+    return Report
+
+"""
+This function takes the dictionary from CompressionReport, and returns it as one line of text
+"""
+def ReportText(Report):
+    return "packed %d -> %d bytes (%.0f%%), load about %.1fs -> %.1fs" % (Report["PlainBytes"],Report["PackedBytes"],100*Report["Ratio"],
+                                                                            Report["PlainSeconds"],Report["PackedSeconds"])
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Pure python writer for Disk Extended Color BASIC (DECB) .DSK disk images, so the converted images can be put on a disk without the ToolShed
+"decb.exe" utility. The whole disk is built in memory, straight from the .BIN file images and the .BAS text made by the conversion script.
+
+A DECB disk is single sided, with 18 sectors of 256 bytes on each track. Track 17 holds the directory: sector 2 is the File Allocation Table
+(FAT), and sectors 3-11 hold the directory entries. Every other track is split into two granules of 9 sectors, which are the units that disk
+space is handed out in. The FAT has one byte per granule: 0xFF is a free granule, 0x00-0xBF is the number of the next granule in the file, and
+0xC1-0xC9 marks the last granule of a file, with the low bits being the number of sectors used in it.
+
+It can also be run from the command line, as a replacement for makedisk.bat:
+    python CoCo3Disk.py MYPIC.BAS
+which puts MYPIC.BAS and the .BIN files that go with it on MYPIC.DSK.
+"""
+import os
+import struct
+
+"""
+Useful constants for the DECB disk format
+"""
+SectorSize = 256
+SectorsPerTrack = 18
+SectorsPerGranule = 9
+DirTrack = 17
+FATSector = 2
+DirSectors = range(3,12)
+DirEntrySize = 32
+DirEntries = len(DirSectors)*SectorSize//DirEntrySize
+GranuleSize = SectorsPerGranule*SectorSize
+DiskTracks = [35,40,80]
+
+"""
+DECB file types, used for the file type byte in the directory entries. These match the decb "-0" to "-3" flags, and the ASCII flag matches "-a".
+"""
+BASICFile = 0
+DataFile = 1
+MLFile = 2
+TextFile = 3
+
+"""
+This function takes the number of tracks (one of DiskTracks), and returns a blank, formatted disk image as a bytearray. Like "decb dskini",
+every byte is 0xFF, which marks every granule in the FAT as free and every directory entry as unused.
+"""
+def NewDisk(Tracks=35):
+    if Tracks not in DiskTracks:
+        raise ValueError("A disk must have "+", ".join(str(i) for i in DiskTracks)+" tracks")
+    return bytearray(b"\xff"*(Tracks*SectorsPerTrack*SectorSize))
+
+"""
+This function takes the disk image, and returns its number of granules (2 per track, not counting the directory track)
+"""
+def Granules(disk):
+    return 2*(len(disk)//(SectorsPerTrack*SectorSize)-1)
+
+"""
+This function takes a track number, and a sector number (starting at 1, like the CoCo does), and returns the offset of that sector in the disk
+"""
+def SectorOffset(track,sector):
+    return (track*SectorsPerTrack+sector-1)*SectorSize
+
+"""
+This function takes a granule number, and returns the offset of its first sector in the disk image. Granules skip over the directory track.
+"""
+def GranuleOffset(granule):
+    track = granule//2
+    if track>=DirTrack:
+        track+=1
+    return SectorOffset(track,1+(granule%2)*SectorsPerGranule)
+
+"""
+This function takes the disk image, and returns a memoryview of its FAT, with one byte per granule
+"""
+def FAT(disk):
+    start = SectorOffset(DirTrack,FATSector)
+    return memoryview(disk)[start:start+Granules(disk)]
+
+"""
+This function takes the disk image, and returns a list of the offsets of all of the directory entries
+"""
+def DirOffsets(disk):
+    return [SectorOffset(DirTrack,sector)+i*DirEntrySize for sector in DirSectors for i in range(SectorSize//DirEntrySize)]
+
+"""
+This function takes a CoCo filename like "MYPIC.BAS", and returns the 11 byte name and extension used in a directory entry
+"""
+def DirName(filename):
+    name,Null,ext = filename.upper().partition(".")
+    if not name or len(name)>8 or len(ext)>3:
+        raise ValueError("Not a valid DECB filename: "+filename)
+    return (name.ljust(8)+ext.ljust(3)).encode("ascii")
+
+"""
+This function takes the disk image, and returns a list of the files on it. Each entry is a 5-tuple of the filename, the file type, True if it is
+an ASCII file, the first granule, and the number of bytes used in the last sector.
+"""
+def ListFiles(disk):
+    files = []
+    for offset in DirOffsets(disk):
+        entry = disk[offset:offset+DirEntrySize]
+        if entry[0]==0xFF: #never used, so there are no more entries after this one
+            break
+        if entry[0]==0x00: #killed file
+            continue
+        name = entry[:8].decode("ascii").rstrip()
+        ext = entry[8:11].decode("ascii").rstrip()
+        files.append((name+"."+ext,entry[11],entry[12]==0xFF,entry[13],struct.unpack(">H",entry[14:16])[0]))
+    return files
+
+"""
+This function takes the length of a file in bytes, and returns the number of granules needed to store it
+"""
+def GranulesNeeded(length):
+    return max(1,-(-length//GranuleSize))
+
+"""
+This function takes the disk image, and a list of file lengths, and returns True if all of those files would fit on the disk, both in free
+granules and in unused directory entries
+"""
+def FilesFit(disk,lengths):
+    FreeGranules = sum(1 for i in FAT(disk) if i==0xFF)
+    FreeEntries = sum(1 for offset in DirOffsets(disk) if disk[offset] in (0x00,0xFF))
+    return sum(GranulesNeeded(i) for i in lengths)<=FreeGranules and len(lengths)<=FreeEntries
+
+"""
+This function stores a file on the disk image. It takes the disk image, the CoCo filename, the file data, the file type (see above), and
+whether it is an ASCII file. Like "decb copy", it raises an error if a file with that name is already on the disk or if it doesn't fit.
+"""
+def AddFile(disk,filename,data,FileType,ASCII=False):
+    dirname = DirName(filename)
+    if any(DirName(i[0])==dirname for i in ListFiles(disk)):
+        raise ValueError(filename+" is already on the disk")
+    if not FilesFit(disk,[len(data)]):
+        raise ValueError("There is no room on the disk for "+filename)
+    fat = FAT(disk)
+    free = [i for i in range(len(fat)) if fat[i]==0xFF]
+    used = free[:GranulesNeeded(len(data))]
+    #copy the data into the granules, and chain them together in the FAT
+    for i,granule in enumerate(used):
+        chunk = data[i*GranuleSize:(i+1)*GranuleSize]
+        disk[GranuleOffset(granule):GranuleOffset(granule)+len(chunk)] = chunk
+        if i<len(used)-1:
+            fat[granule] = used[i+1]
+        else:
+            fat[granule] = 0xC0+max(1,-(-len(chunk)//SectorSize)) #last granule, with the number of sectors used in it
+    LastBytes = len(data)%SectorSize
+    if LastBytes==0 and len(data)>0:
+        LastBytes = SectorSize
+    entry = dirname+bytes([FileType,0xFF if ASCII else 0x00,used[0]])+struct.pack(">H",LastBytes)+b"\x00"*16
+    offset = [i for i in DirOffsets(disk) if disk[i] in (0x00,0xFF)][0]
+    disk[offset:offset+DirEntrySize] = entry
+
+"""
+This function takes the disk image, and a CoCo filename, and returns the data of that file by following its granules through the FAT
+"""
+def ReadFile(disk,filename):
+    dirname = DirName(filename)
+    for name,FileType,ASCII,granule,LastBytes in ListFiles(disk):
+        if DirName(name)==dirname:
+            break
+    else:
+        raise ValueError(filename+" is not on the disk")
+    fat = FAT(disk)
+    data = b""
+    while True:
+        offset = GranuleOffset(granule)
+        if fat[granule]>=0xC0:
+            sectors = fat[granule]-0xC0
+            return data+bytes(disk[offset:offset+(sectors-1)*SectorSize+LastBytes])
+        data += bytes(disk[offset:offset+GranuleSize])
+        granule = fat[granule]
+
+"""
+This function takes the .BAS name, the .BIN name, the list of the 4 .BIN file images, and the text of the .BAS program (the 4-tuple returned by
+ConvertImage), and returns the list of files to put on a disk for that image. Each entry is a 4-tuple of the CoCo filename, the file data, the
+file type, and the ASCII flag, which are the same as the makedisk.bat "decb copy" flags.
+"""
+def ImageFiles(name,truncname,fileImages,BASText):
+    files = [(name+".BAS",BASText.encode("ascii"),BASICFile,True)]
+    for i in range(len(fileImages)):
+        files.append((truncname+" "+str(i+1)+".BIN",fileImages[i],MLFile,False))
+    return files
+
+"""
+This function takes a list of images (each one a list of files from ImageFiles), and the number of tracks per disk, and returns a list of disk
+images. The images are packed onto each disk in order, as many as fit, and a new disk is started whenever the next image doesn't fit (or one of
+its filenames is already on the current disk). The files for one image are never split across two disks.
+"""
+def PackDisks(Images,Tracks=35):
+    disks = [NewDisk(Tracks)]
+    for files in Images:
+        OnDisk = [DirName(i[0]) for i in ListFiles(disks[-1])]
+        if not FilesFit(disks[-1],[len(i[1]) for i in files]) or any(DirName(i[0]) in OnDisk for i in files):
+            disks.append(NewDisk(Tracks))
+            if not FilesFit(disks[-1],[len(i[1]) for i in files]):
+                raise ValueError(files[0][0]+" doesn't fit on an empty disk")
+        for filename,data,FileType,ASCII in files:
+            AddFile(disks[-1],filename,data,FileType,ASCII)
+    if len(disks)>1 and not ListFiles(disks[-1]):
+        disks.pop()
+    return disks
+
+"""
+This function is the command line replacement for makedisk.bat. It takes the filename of a .BAS program made by the conversion script, and the
+number of tracks, and writes a .DSK file with the same base name holding the .BAS file and its .BIN files (four for HSCREEN 2 and 4, two for
+HSCREEN 1 and 3).
+"""
+def MakeDisk(BASFile,Tracks=35):
+    base = os.path.splitext(BASFile)[0]
+    name = os.path.basename(base).upper()
+    with open(BASFile,'rb') as infile:
+        files = [(name+".BAS",infile.read(),BASICFile,True)]
+    for i in range(4):
+        BINFile = base[:len(base)-len(name)]+name[:6]+" "+str(i+1)+".BIN"
+        if i>0 and not os.path.exists(BINFile): #the 2 color and 4 color 320 wide modes only take two banks
+            break
+        with open(BINFile,'rb') as infile:
+            files.append((name[:6]+" "+str(i+1)+".BIN",infile.read(),MLFile,False))
+    disk = PackDisks([files],Tracks)[0]
+    with open(base+".DSK",'wb') as outfile:
+        outfile.write(disk)
+    for filename,FileType,ASCII,Null,Null in ListFiles(disk):
+        print("%-12s %d %s" % (filename,FileType,"A" if ASCII else "B"))
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv)<2:
+        print("Usage: python CoCo3Disk.py MYPIC.BAS [tracks]")
+        sys.exit(1)
+    MakeDisk(sys.argv[1],int(sys.argv[2]) if len(sys.argv)>2 else 35)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Dithering for the CoCo 3 image converter. These functions work on the fitted screen image as a float array of (R,G,B) values, and map it onto
+the colors picked for the palette. They return an array of palette slot numbers (0-15 for 16 colors), one per pixel, which is exactly what
+EncodeScreen packs into the screen data.
+
+Error diffusion (Floyd-Steinberg and Atkinson) normally has to visit one pixel at a time, because each pixel depends on the error pushed to it by
+the pixels before it. But a pixel only depends on pixels to its left in the same row, and on a few pixels around it in the rows above, so every
+pixel on a slanted line (x+Slope*y is the same) can be done at the same time. The left-to-right scan does the image one slanted line at a time,
+with each line being a single numpy operation. The serpentine scan (every other row goes right-to-left) breaks that trick, so it goes row by row
+and is a lot slower. Ordered (Bayer) dithering doesn't push any error around at all, so it is done in one pass over the whole array.
+
+Run this file directly to benchmark the speed and color error of each dither mode against the PIL Floyd-Steinberg dithering:
+    python CoCo3Dither.py [image files]
+"""
+import numpy as np
+
+"""
+Error diffusion kernels. The keys are the dither mode names, and the definitions are a list of 3-tuples of (dy,dx,weight). The error for each
+pixel is pushed to the pixel dy rows down and dx columns to the right, multiplied by the weight.
+Atkinson only pushes 3/4 of the error along, which keeps the highlights and shadows cleaner.
+"""
+Kernels = {"floyd-steinberg":[(0,1,7/16),(1,-1,3/16),(1,0,5/16),(1,1,1/16)],
+           "atkinson":[(0,1,1/8),(0,2,1/8),(1,-1,1/8),(1,0,1/8),(1,1,1/8),(2,0,1/8)]}
+
+"""
+Ordered dithering constants. BayerSize is the width and height of the Bayer threshold matrix (a power of 2), and BayerSpread is how far (in
+color levels) the thresholds move each pixel. The CoCo RGB palette has 85 levels between each color component value, so 64 keeps the pattern from
+jumping past the next color.
+"""
+BayerSize = 8
+BayerSpread = 64
+
+"""
+Dictionary of the dither modes, for use with MenuChoice. The keys are the selection choices, and the definitions are a 2-tuple of the mode name
+and a description. "pil" is the PIL Floyd-Steinberg dithering the script has always used, which isn't done by this module.
+"""
+DitherChoices = {"n":("none","No dithering"),
+                 "p":("pil","Floyd-Steinberg, done by PIL (recommended)"),
+                 "f":("floyd-steinberg","Floyd-Steinberg"),
+                 "a":("atkinson","Atkinson"),
+                 "b":("bayer","Ordered (Bayer) dithering")}
+DitherModes = [i[0] for i in DitherChoices.values()]
+
+"""
+This function takes an array of (R,G,B) colors of any shape (the last axis must be R,G,B), and the array of the (R,G,B) palette colors, and
+returns an array of the number of the nearest palette color for each color. The squared distance is |p|^2-2p.c+|c|^2, and |p|^2 is the same
+for every palette color, so only the matrix product and |c|^2 are needed.
+"""
+def NearestSlot(pixels,Palette):
+    return ((Palette**2).sum(axis=1)-2*pixels@Palette.T).argmin(axis=-1)
+
+"""
+This function returns the n x n Bayer threshold matrix (n must be a power of 2), with values from 0 to n*n-1
+"""
+def BayerMatrix(n):
+    M = np.zeros((1,1),dtype=np.int64)
+    while len(M)<n:
+        M = np.block([[4*M,4*M+2],[4*M+3,4*M+1]])
+    return M
+
+"""
+This function takes the (H,W,3) float image, and the (16,3) palette, and returns the (H,W) array of palette slots using ordered dithering.
+Each pixel is moved by its Bayer threshold before finding the nearest palette color.
+"""
+def OrderedDither(pixels,Palette,Size=BayerSize,Spread=BayerSpread):
+    H,W = pixels.shape[:2]
+    M = (BayerMatrix(Size)+0.5)/(Size*Size)-0.5 #thresholds evenly spread between -0.5 and 0.5
+    M = np.tile(M,(H//Size+1,W//Size+1))[:H,:W]
+    return NearestSlot(pixels+Spread*M[:,:,None],Palette)
+
+"""
+This function takes the (H,W,3) float image, the (16,3) palette, and an error diffusion kernel, and returns the (H,W) array of palette slots.
+It scans left to right, one slanted line of pixels at a time (see the description at the top of this file).
+"""
+def ErrorDiffusion(pixels,Palette,Kernel):
+    H,W = pixels.shape[:2]
+    pad = max(abs(dx) for dy,dx,w in Kernel)
+    buf = np.zeros((H+max(dy for dy,dx,w in Kernel),W+2*pad,3))
+    buf[:H,pad:pad+W] = pixels
+    #a pixel has to come after everything that pushes error to it: with t = x+Slope*y, (y-dy,x-dx) comes first if Slope*dy > -dx
+    Slope = max([1]+[(-dx)//dy+1 for dy,dx,w in Kernel if dy>0])
+    out = np.empty((H,W),dtype=np.uint8)
+    for t in range(W+Slope*(H-1)):
+        ys = np.arange(max(0,-((W-1-t)//Slope)),min(H-1,t//Slope)+1) #the rows that have a pixel on this line
+        xs = t-Slope*ys
+        old = np.clip(buf[ys,xs+pad],0,255)
+        slot = NearestSlot(old,Palette)
+        out[ys,xs] = slot
+        err = old-Palette[slot]
+        for dy,dx,w in Kernel: #the pixels on one line never push error to the same pixel, so this is safe to do all at once
+            buf[ys+dy,xs+pad+dx] += w*err
+    return out
+
+"""
+This function takes the (H,W,3) float image, the (16,3) palette, and an error diffusion kernel, and returns the (H,W) array of palette slots.
+It scans every other row right to left (a serpentine scan), which cuts down on the diagonal "worm" patterns. The error pushed within a row has
+to be carried one pixel at a time, but the error pushed down to the rows below is added for the whole row at once.
+"""
+def SerpentineErrorDiffusion(pixels,Palette,Kernel):
+    H,W = pixels.shape[:2]
+    pad = max(abs(dx) for dy,dx,w in Kernel)
+    buf = np.zeros((H+max(dy for dy,dx,w in Kernel),W+2*pad,3))
+    buf[:H,pad:pad+W] = pixels
+    Same = [(dx,w) for dy,dx,w in Kernel if dy==0]
+    Below = [(dy,dx,w) for dy,dx,w in Kernel if dy>0]
+    PalList = Palette.tolist()
+    out = np.empty((H,W),dtype=np.uint8)
+    for y in range(H):
+        step = 1 if y%2==0 else -1 #odd rows go right to left, with the kernel mirrored
+        row = buf[y,pad:pad+W].tolist()
+        carry = [[0.0,0.0,0.0] for i in range(W+2*pad)] #error pushed along this row, indexed by x+pad
+        slots = [0]*W
+        errs = [None]*W
+        for x in (range(W) if step==1 else range(W-1,-1,-1)):
+            r,g,b = [min(max(v+c,0.0),255.0) for v,c in zip(row[x],carry[x+pad])]
+            slot = min(range(len(PalList)),key=lambda i:(r-PalList[i][0])**2+(g-PalList[i][1])**2+(b-PalList[i][2])**2)
+            er,eg,eb = r-PalList[slot][0],g-PalList[slot][1],b-PalList[slot][2]
+            for dx,w in Same:
+                c = carry[x+pad+step*dx]
+                c[0] += w*er
+                c[1] += w*eg
+                c[2] += w*eb
+            slots[x] = slot
+            errs[x] = (er,eg,eb)
+        out[y] = slots
+        errs = np.array(errs)
+        for dy,dx,w in Below:
+            buf[y+dy,pad+step*dx:pad+step*dx+W] += w*errs
+    return out
+
+"""
+This function takes the (H,W,3) float image, the list of (R,G,B) palette colors, the dither mode name (see DitherModes, but not "pil"), and
+whether to use a serpentine scan for error diffusion, and returns the (H,W) array of palette slots.
+"""
+def DitherImage(pixels,Colors,Mode,Serpentine=False):
+    Palette = np.array(Colors,dtype=np.float64)
+    pixels = np.asarray(pixels,dtype=np.float64)
+    if Mode=="none":
+        return NearestSlot(pixels,Palette)
+    elif Mode=="bayer":
+        return OrderedDither(pixels,Palette)
+    elif Mode in Kernels:
+        if Serpentine:
+            return SerpentineErrorDiffusion(pixels,Palette,Kernels[Mode])
+        return ErrorDiffusion(pixels,Palette,Kernels[Mode])
+    raise ValueError("Unknown dither mode: "+str(Mode))
+
+"""
+This function runs the benchmark. For each image, it times every dither mode (plus the serpentine scans) with the same 16 color palette, and
+prints the time taken and two color errors against the fitted image: the plain mean squared error per pixel, and the mean squared error after
+both images are blurred a little, which is closer to what the eye sees from a dithered image.
+"""
+def Benchmark(filenames,Monitor="R",Repeats=3):
+    import time
+    from PIL import Image, ImageFilter
+    import Image2CoCo3_3 as I2C
+    CC_Colors = I2C.CCMonitors[Monitor][1]
+    Runs = [(i,False) for i in DitherModes]+[(i,True) for i in Kernels]
+    print("%-20s %-30s %10s %10s %12s" % ("image","mode","ms","MSE","blurred MSE"))
+    for filename in filenames:
+        image = I2C.FitImage(Image.open(filename).convert("RGB"),1,1,1,CC_Colors[0])
+        blurred = np.asarray(image.filter(ImageFilter.GaussianBlur(1)),dtype=np.float64)
+        for Mode,Serpentine in Runs:
+            times = []
+            for i in range(Repeats):
+                start = time.perf_counter()
+                imagep,Null = I2C.QuantizeImage(image,CC_Colors,Mode,Serpentine)
+                times.append(time.perf_counter()-start)
+            result = imagep.convert("RGB")
+            mse = ((np.asarray(result,dtype=np.float64)-np.asarray(image,dtype=np.float64))**2).sum(axis=2).mean()
+            bmse = ((np.asarray(result.filter(ImageFilter.GaussianBlur(1)),dtype=np.float64)-blurred)**2).sum(axis=2).mean()
+            print("%-20s %-30s %10.1f %10.1f %12.1f" % (filename[-20:],Mode+(" (serpentine)" if Serpentine else ""),1000*min(times),mse,bmse))
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv)<2:
+        print("Usage: python CoCo3Dither.py image [image ...]")
+        sys.exit(1)
+    Benchmark(sys.argv[1:])
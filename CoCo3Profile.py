@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Stage timing and benchmarking for the CoCo 3 image converter. ConvertImage is split into named stages (see StageNames), and each one runs inside
+Stage(), which adds the time the stage took, and the peak memory it used, to a dictionary of timings for that image. Passing None instead of a
+dictionary turns the timing off, so a normal conversion doesn't pay for it.
+
+Peak memory comes from the python tracemalloc module, so it is only measured while tracemalloc is running. Tracing slows everything down a lot, so
+the benchmark does its timing runs and its memory run separately. It counts numpy arrays and python objects, but not the pixel buffers that PIL
+keeps inside its images.
+
+Run this file directly to benchmark the converter on a fixed set of synthetic images of different sizes and shapes, with both the RGB and the
+CMP palettes:
+    python CoCo3Profile.py -o report.json [--csv report.csv] [--baseline old.json]
+The report holds the time and peak memory of every stage for each image, the averages, and the number of images converted per second. Given the
+report from an earlier version as a baseline, any stage (or the overall speed) that got slower by more than the tolerance is listed as a
+regression, and the exit status is 1.
+
+With --ingest, it instead compares two ways of loading big source images: decoding the whole image and then fitting it to the screen (the way
+it used to be done), and OpenImage, which decodes it at about the size it is needed. Each load runs in a fresh process, so the peak memory can be
+taken from the operating system, PIL's pixel buffers included:
+    python CoCo3Profile.py --ingest [-o ingest.json]
+The report holds the time and peak memory of both, and how different the fitted images are. If any of them differ by more than IngestTolerance,
+the exit status is 1.
+"""
+import concurrent.futures
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image, ImageOps, __version__ as PILVersion
+try:
+    import resource
+except ImportError: #Windows
+    resource = None
+
+"""
+The stages of a conversion, in the order they run. "cache" only runs when the conversion cache is used, and everything from "decode" to "pack"
+is skipped on a cache hit. "write" is writing the .BIN and .BAS files, which happens outside of ConvertImage.
+"""
+StageNames = ["read","cache","decode","fit","palette","dither","pack","bin","bas","write"]
+
+"""
+The synthetic benchmark images. Each entry is a 4-tuple of the name, width, height, and file format. They cover a native size image, a small one
+that gets scaled up, the common photo and screen shapes, and one big camera image, so both ends of the fitting and decoding are exercised.
+"""
+BenchImages = [("native",320,192,"PNG"),
+               ("small",160,100,"PNG"),
+               ("vga",640,480,"JPEG"),
+               ("square",1024,1024,"PNG"),
+               ("hd",1920,1080,"JPEG"),
+               ("portrait",1080,1920,"JPEG"),
+               ("camera",4000,3000,"JPEG")]
+BenchSeed = 3
+
+"""
+The big images for the ingestion benchmark. Each entry is a 5-tuple of the name, width, height, file format, and EXIF orientation (1 is upright,
+6 is a camera held on its side). They are made at IngestScale times smaller and scaled up, since the synthetic image generator would need a few
+GB for the biggest one.
+IngestTolerance is the most the fitted images from the two ways of loading may differ, as the mean squared error of the color values (0-255).
+"""
+IngestImages = [("camera",4000,3000,"JPEG",1),
+                ("rotated",4000,3000,"JPEG",6),
+                ("scan",8000,6000,"JPEG",1),
+                ("poster",4000,4000,"PNG",1)]
+IngestScale = 4
+IngestTolerance = 2.0
+DefaultTolerance = 0.10
+MinCompareMs = 1.0 #stages faster than this are too noisy to compare
+
+"""
+This context manager times the block inside it as the stage called name, and adds the time in seconds to Timings[name]. If tracemalloc is running,
+the most memory allocated at once during the block is also kept in Timings[name+"_peak"], in bytes. Stages must not be nested, because
+tracemalloc only has one peak to reset. If Timings is None, it does nothing.
+"""
+@contextlib.contextmanager
+def Stage(Timings,name):
+    if Timings is None:
+        yield
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        Timings[name] = Timings.get(name,0.0)+time.perf_counter()-start
+        if tracing:
+            Timings[name+"_peak"] = max(Timings.get(name+"_peak",0),tracemalloc.get_traced_memory()[1]-base)
+
+"""
+This function takes the name of an image, the monitor type, and the dictionary of timings filled in by Stage, plus any other columns to add, and
+returns one row of the report. Times are in milliseconds and memory in kB, and stages that didn't run (or memory that wasn't measured) are None.
+"""
+def ImageRow(Name,Monitor,Timings,**columns):
+    Row = {"image":Name,"monitor":Monitor}
+    Row.update(columns)
+    for name in StageNames:
+        Row[name+"_ms"] = 1000*Timings[name] if name in Timings else None
+    for name in StageNames:
+        Row[name+"_peak_kb"] = Timings[name+"_peak"]/1024 if name+"_peak" in Timings else None
+    Row["total_ms"] = 1000*sum(Timings.get(name,0.0) for name in StageNames)
+    Peaks = [Timings[name+"_peak"] for name in StageNames if name+"_peak" in Timings]
+    Row["peak_kb"] = max(Peaks)/1024 if Peaks else None
+    return Row
+
+"""
+This function takes the list of report rows, and returns a dictionary of the averages: the mean time of each stage (over the images where it ran),
+the biggest peak memory, and the number of images converted per second. If the wall clock time of the whole run (Elapsed) is given, as it is for a
+batch spread over several processes, images per second comes from that instead of from adding up the time spent on each image.
+"""
+def Aggregate(Rows,Elapsed=None):
+    Result = {"images":len(Rows)}
+    for column in [name+"_ms" for name in StageNames]+["total_ms"]:
+        values = [Row[column] for Row in Rows if Row.get(column) is not None]
+        Result[column] = sum(values)/len(values) if values else None
+    for column in [name+"_peak_kb" for name in StageNames]+["peak_kb"]:
+        values = [Row[column] for Row in Rows if Row.get(column) is not None]
+        Result[column] = max(values) if values else None
+    if Elapsed is None:
+        Elapsed = sum(Row["total_ms"] for Row in Rows)/1000
+    Result["images_per_s"] = len(Rows)/Elapsed if Elapsed>0 else None
+    return Result
+
+"""
+This function takes the list of report rows, the wall clock time of the run (see Aggregate), and a label for the run (a version number, say), and
+returns the whole report as a dictionary, including the library versions so reports from different machines can be told apart. The averages
+come from Aggregate, unless a dictionary of them (Result) is given.
+"""
+def MakeReport(Rows,Elapsed=None,Label="",Result=None):
+    Environment = {"python":platform.python_version(),"numpy":np.__version__,"pillow":PILVersion,"machine":platform.machine(),"system":platform.system()}
+    if Result is None:
+        Result = Aggregate(Rows,Elapsed)
+    return {"label":Label,"time":time.strftime("%Y-%m-%d %H:%M:%S"),"environment":Environment,"images":Rows,"aggregate":Result}
+
+"""
+This context manager runs tracemalloc while the block inside it runs, so Stage measures the peak memory of each stage too. If Memory is False (or
+tracemalloc is already running), it does nothing.
+"""
+@contextlib.contextmanager
+def Tracing(Memory=True):
+    if not Memory or tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+"""
+This function writes a report to a file. A filename ending in .csv gets one line per image, plus a last line of averages (with "*" as the image
+name); anything else gets the whole report as JSON.
+"""
+def WriteReport(filename,Report):
+    if filename.lower().endswith(".csv"):
+        Rows = Report["images"]+[dict(Report["aggregate"],image="*")]
+        columns = []
+        for Row in Rows:
+            columns += [i for i in Row if i not in columns]
+        with open(filename,'w',newline='') as outfile:
+            writer = csv.DictWriter(outfile,fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(Rows)
+    else:
+        with open(filename,'w') as outfile:
+            json.dump(Report,outfile,indent=1)
+
+"""
+This function compares a report with the report from an earlier run (Baseline), and returns a list of messages, one for each regression: a stage
+whose average time went up by more than Tolerance (as a fraction), or a drop of more than that in images per second. Stages that took less than
+MinCompareMs in the baseline are skipped, since their times are mostly noise.
+"""
+def CompareReports(Report,Baseline,Tolerance=DefaultTolerance):
+    New,Old = Report["aggregate"],Baseline["aggregate"]
+    Messages = []
+    for column in [name+"_ms" for name in StageNames]+["total_ms"]:
+        if New.get(column) is not None and Old.get(column) is not None and Old[column]>=MinCompareMs and New[column]>Old[column]*(1+Tolerance):
+            Messages.append("%s went from %.1fms to %.1fms (%+.0f%%)" % (column[:-3],Old[column],New[column],100*(New[column]/Old[column]-1)))
+    if New.get("images_per_s") and Old.get("images_per_s") and New["images_per_s"]<Old["images_per_s"]/(1+Tolerance):
+        Messages.append("images/s went from %.2f to %.2f" % (Old["images_per_s"],New["images_per_s"]))
+    return Messages
+
+"""
+This function takes a width, a height, and a random number seed, and returns a synthetic RGB test image as a PIL image. It has smooth gradients
+(which need dithering), a few flat colored circles (which have hard edges), and some noise (like a photo), and the same seed always gives the
+same image.
+"""
+def SyntheticImage(Width,Height,Seed=BenchSeed):
+    rng = np.random.default_rng(Seed)
+    scale = max(Width,Height)
+    x = np.arange(Width,dtype=np.float32)[None,:]/scale
+    y = np.arange(Height,dtype=np.float32)[:,None]/scale
+    pixels = np.empty((Height,Width,3),dtype=np.float32)
+    for k in range(3):
+        fx,fy,phase = rng.uniform(0.5,3.0),rng.uniform(0.5,3.0),rng.uniform(0,2*np.pi)
+        pixels[:,:,k] = 127.5+127.5*np.sin(2*np.pi*(fx*x+fy*y)+phase)
+    for i in range(6):
+        cx,cy,radius = rng.uniform(0,Width/scale),rng.uniform(0,Height/scale),rng.uniform(0.05,0.2)
+        pixels[(x-cx)**2+(y-cy)**2<radius**2] = rng.integers(0,256,3)
+    pixels += rng.normal(0,8,(Height,Width,3)).astype(np.float32)
+    return Image.fromarray(np.clip(pixels,0,255).astype(np.uint8),"RGB")
+
+"""
+This function writes the synthetic benchmark images (see BenchImages) into a directory, and returns a list of 2-tuples of the image name and its
+filename
+"""
+def WriteBenchImages(directory,Images=BenchImages):
+    files = []
+    for i,(name,Width,Height,Format) in enumerate(Images):
+        filename = os.path.join(directory,name+"."+Format.lower().replace("jpeg","jpg"))
+        SyntheticImage(Width,Height,BenchSeed+i).save(filename,Format)
+        files.append((name,filename))
+    return files
+
+"""
+This function runs the benchmark. It converts every synthetic image with each monitor type in Monitors, using the conversion options in Options,
+and returns the report. Every conversion is timed Repeats times and the median of each stage is kept, then (if Memory is True) it is done once
+more with tracemalloc running to measure the peak memory of each stage.
+"""
+def Benchmark(Options,Monitors=("R","C"),Repeats=3,Memory=True,Label=""):
+    import Image2CoCo3_3 as I2C #not at the top, since Image2CoCo3_3 imports this module
+    Rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = WriteBenchImages(tmpdir)
+        outdir = os.path.join(tmpdir,"out")
+        os.makedirs(outdir)
+        def Run(filename,RunOptions):
+            Timings = {}
+            Converted = I2C.ConvertImage(filename,RunOptions,Timings=Timings)
+            with Stage(Timings,"write"):
+                I2C.WriteOutputs(outdir,*Converted)
+            return Timings
+        for Monitor in Monitors:
+            RunOptions = dict(Options,Monitor=Monitor)
+            Run(files[0][1],RunOptions) #warm up, so loading the libraries isn't counted
+            for (name,Width,Height,Format),(Null,filename) in zip(BenchImages,files):
+                runs = [Run(filename,RunOptions) for i in range(Repeats)]
+                Timings = {stage:float(np.median([run[stage] for run in runs])) for stage in runs[0]}
+                if Memory:
+                    with Tracing():
+                        Timings.update({k:v for k,v in Run(filename,RunOptions).items() if k.endswith("_peak")})
+                Rows.append(ImageRow(name,Monitor,Timings,width=Width,height=Height,format=Format))
+                print("%-10s %s %5dx%-5d %9.1fms" % (name,Monitor,Width,Height,Rows[-1]["total_ms"]))
+    return MakeReport(Rows,Label=Label)
+
+"""
+This function runs in a fresh process for each load in the ingestion benchmark. It takes the image filename, whether to use the old full size
+decode (Full) or OpenImage, and whether the image is stretched and the HSCREEN mode number, and returns a 3-tuple of the seconds the load and fit
+took, the peak memory of the process in bytes (or None where that can't be measured), and the fitted RGB image as bytes. Both ways start from
+the same process with the same modules loaded, so the difference between their peaks is the difference the loading makes.
+"""
+def IngestRun(filename,Full,Stretch,Mode):
+    import Image2CoCo3_3 as I2C
+    start = time.perf_counter()
+    with open(filename,'rb') as infile:
+        data = infile.read()
+    if Full:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)).convert("RGB"))
+        image = I2C.FitImage(image,Stretch,1,1,(0,0,0),Mode)
+    else:
+        image,SourceSize = I2C.OpenImage(data,Stretch,Mode)
+        image = I2C.FitImage(image,Stretch,1,1,(0,0,0),Mode,SourceSize)
+    seconds = time.perf_counter()-start
+    peak = None
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*(1 if sys.platform=="darwin" else 1024) #macOS gives bytes, the rest kB
+    return seconds,peak,image.tobytes()
+
+"""
+This function runs the ingestion benchmark. It loads every image in IngestImages both ways, Repeats times each, with the conversion options in
+Options, and returns the report. The median time and the biggest peak memory of each are kept.
+"""
+def IngestBenchmark(Options,Repeats=3,Label=""):
+    Rows = []
+    tmpdir = tempfile.TemporaryDirectory()
+    #a forkserver child starts out as a copy of a small process, so its peak memory is its own (a spawned one keeps the peak of this one on Linux)
+    context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    for i,(name,Width,Height,Format,Orientation) in enumerate(IngestImages):
+        image = SyntheticImage(Width//IngestScale,Height//IngestScale,BenchSeed+i).resize((Width,Height),Image.BICUBIC)
+        if Orientation in (5,6,7,8):
+            image = image.transpose(Image.TRANSPOSE) #stored on its side, so the EXIF orientation turns it back
+        exif = Image.Exif()
+        exif[0x0112] = Orientation
+        filename = os.path.join(tmpdir.name,name+"."+Format.lower().replace("jpeg","jpg"))
+        image.save(filename,Format,exif=exif.tobytes())
+        del image
+        Row = {"image":name,"width":Width,"height":Height,"format":Format,"orientation":Orientation}
+        fitted = {}
+        for Way,Full in [("full",True),("fast",False)]:
+            runs = []
+            for k in range(Repeats):
+                with concurrent.futures.ProcessPoolExecutor(1,mp_context=context) as executor:
+                    runs.append(executor.submit(IngestRun,filename,Full,Options["Stretch"],Options["Mode"]).result())
+            Row[Way+"_ms"] = 1000*float(np.median([run[0] for run in runs]))
+            Row[Way+"_peak_mb"] = max(run[1] for run in runs)/2**20 if runs[0][1] is not None else None
+            fitted[Way] = np.frombuffer(runs[0][2],dtype=np.uint8).astype(np.float32)
+        Row["speedup"] = Row["full_ms"]/Row["fast_ms"]
+        Row["mse"] = float(np.mean((fitted["full"]-fitted["fast"])**2))
+        Rows.append(Row)
+        print("%-8s %5dx%-5d %-4s %8.1fms %8.1fms %5.1fx %8s %8s  mse %.2f" % (name,Width,Height,Format,Row["full_ms"],Row["fast_ms"],Row["speedup"],
+              "%.0fMB" % Row["full_peak_mb"] if Row["full_peak_mb"] is not None else "-",
+              "%.0fMB" % Row["fast_peak_mb"] if Row["fast_peak_mb"] is not None else "-",Row["mse"]))
+    tmpdir.cleanup()
+    Result = {"images":len(Rows),"speedup":float(np.exp(np.mean(np.log([Row["speedup"] for Row in Rows])))),"max_mse":max(Row["mse"] for Row in Rows)}
+    for column in ["full_peak_mb","fast_peak_mb"]:
+        values = [Row[column] for Row in Rows if Row[column] is not None]
+        Result[column] = max(values) if values else None
+    return MakeReport(Rows,Label=Label,Result=Result)
+
+"""
+This function prints the averages from a report as a table, one line per stage
+"""
+def PrintAggregate(Report):
+    Result = Report["aggregate"]
+    print("%-10s %10s %12s" % ("stage","mean ms","peak kB"))
+    for name in StageNames+["total"]:
+        ms = Result.get(name+"_ms")
+        kb = Result.get(name+"_peak_kb" if name!="total" else "peak_kb")
+        if ms is not None:
+            print("%-10s %10.1f %12s" % (name,ms,"%.0f" % kb if kb is not None else "-"))
+    print("%d images, %.2f images/s" % (Result["images"],Result["images_per_s"] or 0.0))
+
+"""
+This function runs the benchmark from the command line arguments (argv), and returns the exit status
+"""
+def BenchMain(argv):
+    import Image2CoCo3_3 as I2C
+    parser = I2C.ConversionParser("Benchmark each stage of the CoCo 3 image conversion on a fixed set of synthetic images.")
+    parser.add_argument("-o","--output",help="write the report to this JSON file")
+    parser.add_argument("--csv",help="also write the report to this CSV file")
+    parser.add_argument("--baseline",help="JSON report from an earlier run to check for regressions")
+    parser.add_argument("--tolerance",type=float,default=100*DefaultTolerance,help="percent slowdown counted as a regression [default: %(default)g]")
+    parser.add_argument("--repeats",type=int,default=3,help="timing runs per image, the median is kept [default: %(default)d]")
+    parser.add_argument("--no-memory",dest="memory",action="store_false",help="skip the peak memory run")
+    parser.add_argument("--label",default="",help="label for this run in the report, like a version number")
+    parser.add_argument("--ingest",action="store_true",help="compare loading big images at full size with OpenImage instead")
+    args = parser.parse_args(argv)
+    try:
+        Options = I2C.BatchOptions(args)
+    except (OSError,ValueError,KeyError) as err:
+        parser.error(str(err))
+    if args.ingest:
+        Report = IngestBenchmark(Options,args.repeats,args.label)
+        Result = Report["aggregate"]
+        print("%.1fx faster on average, peak memory %s -> %s, biggest mean squared error %.2f" % (Result["speedup"],
+              "%.0fMB" % Result["full_peak_mb"] if Result["full_peak_mb"] is not None else "-",
+              "%.0fMB" % Result["fast_peak_mb"] if Result["fast_peak_mb"] is not None else "-",Result["max_mse"]))
+        for filename in [args.output,args.csv]:
+            if filename:
+                WriteReport(filename,Report)
+        if Result["max_mse"]>IngestTolerance:
+            print("FAILED mean squared error is over %g" % IngestTolerance)
+            return 1
+        return 0
+    Report = Benchmark(Options,[args.monitor] if args.monitor else ["R","C"],args.repeats,args.memory,args.label)
+    PrintAggregate(Report)
+    if args.output:
+        WriteReport(args.output,Report)
+    if args.csv:
+        WriteReport(args.csv,Report)
+    if args.baseline:
+        with open(args.baseline) as infile:
+            Messages = CompareReports(Report,json.load(infile),args.tolerance/100)
+        for message in Messages:
+            print("REGRESSION "+message)
+        if Messages:
+            return 1
+        print("No regressions against "+args.baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(BenchMain(sys.argv[1:]))
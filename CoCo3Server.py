@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Local conversion server for the CoCo 3 image converter. Starting python, and importing PIL, numpy and the image plugins,
+takes far longer than converting one image, so a build system that converts images one at a time can send them to this server instead. It runs
+a fixed pool of worker processes that stay running, each one warmed up by a tiny conversion for both monitor types, and answers requests over
+HTTP on localhost.
+
+    python CoCo3Server.py [--port 8333] [-j workers] [--queue 16] [--cache [DIR]]
+
+POST /convert
+    The request body is the image file. The conversion options (see DefaultOptions in Image2CoCo3_3.py) go in the query string, like
+    /convert?name=MYPIC.JPG&Monitor=C&Dither=bayer. name is used to make the CoCo filenames. The answer is JSON with the .BAS name, the .BIN
+    name, the text of the .BAS program, and the .BIN files (base64 encoded). Add format=dsk (and tracks=35, 40 or 80) to get a .DSK image
+    holding the files instead.
+GET /metrics
+    JSON with the number of requests waiting and running, the counts of finished, failed and rejected requests and of worker pool restarts,
+    the 50th, 90th and 99th percentile latencies of the recent requests, and the throughput.
+
+Only Workers+MaxQueue requests are taken at once. When that many are already waiting or running, a new request is turned away straight away with
+"503 Service Unavailable" and a Retry-After header, before its body is read, instead of piling up, so the client knows to slow down. A body bigger
+than MaxUpload bytes is turned away with "413 Content Too Large".
+
+A request that fails because of what was sent (options that aren't valid, or a file that isn't an image PIL can read) gets "400 Bad Request".
+Anything else that goes wrong is the server's fault, and gets "500 Internal Server Error". If a worker process dies (it runs out of memory on a
+huge image, say), the pool can't be used any more, so it is replaced with a new one and the request gets a 500.
+"""
+import base64
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import http.server
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+import numpy as np
+from PIL import Image
+import Image2CoCo3_3 as I2C
+import CoCo3Cache
+import CoCo3Disk
+
+"""
+Useful constants for the server
+DefaultPort is the TCP port it listens on (on localhost only), DefaultQueue is how many requests can wait for a worker, DefaultMaxUpload is the
+biggest request body taken, in bytes, LatencyWindow is how many of the most recent requests the latency percentiles are worked out from,
+ThroughputWindow is the number of seconds the recent throughput is measured over, and RetryAfter is the number of seconds a turned away client is
+told to wait. InputErrors are the exceptions a conversion raises when the request itself is bad: ValueError from the option checks and from
+OpenImage, and what PIL raises for a file it can't decode (see BadInput for the rest).
+"""
+DefaultPort = 8333
+DefaultQueue = 16
+DefaultMaxUpload = 64*1024*1024
+LatencyWindow = 1000
+ThroughputWindow = 60
+RetryAfter = 1
+InputErrors = (ValueError,EOFError,SyntaxError,Image.DecompressionBombError)
+
+"""
+This function runs once in each worker process when it starts, before it takes any work. It converts a tiny blank image for each monitor type, so every library and image
+plugin a conversion uses is already loaded, and no request has to wait for it.
+"""
+def WarmWorker():
+    outfile = io.BytesIO()
+    I2C.Image.new("RGB",(32,24)).save(outfile,"PNG")
+    for Monitor in I2C.CCMonitors:
+        I2C.ConvertData(outfile.getvalue(),"WARMUP",dict(I2C.DefaultOptions,Monitor=Monitor))
+
+"""
+This function is what each worker process runs for a request. It takes the image file bytes, the filename, the dictionary of conversion options,
+the number of tracks for a .DSK image (or None), and the cache directory and size limit, and returns the 4-tuple returned by ConvertImage, or
+the .DSK image if Tracks is given.
+"""
+def ConvertRequest(data,filename,Options,Tracks,CacheDir,CacheSize):
+    Converted = I2C.ConvertData(data,filename,Options,CacheDir,CacheSize)
+    if Tracks:
+        return bytes(CoCo3Disk.PackDisks([CoCo3Disk.ImageFiles(*Converted)],Tracks)[0])
+    return Converted
+
+"""
+This function takes an exception raised by a conversion, and returns True if it was caused by the request (see InputErrors). PIL reports files it
+can't read (or that are cut short) as an OSError with no error number, unlike real system errors like a full disk.
+"""
+def BadInput(err):
+    return isinstance(err,InputErrors) or (isinstance(err,OSError) and err.errno is None)
+
+"""
+This function takes the number of worker processes, and returns a new process pool for them. The workers are started straight away instead of
+on the first requests (the pool starts one for each task it is given while none are free), and each one warms up (see WarmWorker) before it
+takes any work.
+"""
+def StartWorkers(Workers):
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=Workers,initializer=WarmWorker)
+    concurrent.futures.wait([executor.submit(os.getpid) for i in range(Workers)])
+    return executor
+
+"""
+This function replaces the server's process pool after a worker process died (broken is the pool that broke). Many requests can find out about the
+same broken pool at once, but only the first one replaces it.
+"""
+def RestartWorkers(server,broken):
+    with server.restartlock:
+        if server.executor is broken:
+            server.executor = StartWorkers(server.workers)
+            with server.lock:
+                server.counts["restarts"]+=1
+    broken.shutdown(wait=False)
+
+"""
+This function takes the parsed query string of a request (a dictionary of lists of values), and returns the dictionary of conversion options.
+The option names are the same as in DefaultOptions, but upper and lower case don't matter.
+"""
+def RequestOptions(Query):
+    Options = dict(I2C.DefaultOptions)
+    Names = {i.lower():i for i in Options}
+    for key,values in Query.items():
+        if key.lower() in Names:
+            name = Names[key.lower()]
+            Options[name] = values[-1] if isinstance(I2C.DefaultOptions[name],str) else int(values[-1])
+    return I2C.CheckOptions(Options)
+
+"""
+This function takes the server, and returns the dictionary of metrics for /metrics
+"""
+def Metrics(server):
+    with server.lock:
+        Latencies = list(server.latencies)
+        Finished = list(server.finished)
+        Counts = dict(server.counts)
+        InFlight = server.inflight
+    now = time.monotonic()
+    Result = {"workers":server.workers,"max_queue":server.maxqueue,"in_flight":InFlight,"queue_depth":max(0,InFlight-server.workers)}
+    Result.update(Counts)
+    for p in [50,90,99]:
+        Result["latency_p%d_ms" % p] = 1000*float(np.percentile(Latencies,p)) if Latencies else None
+    Result["uptime_s"] = now-server.started
+    Result["throughput_per_s"] = Counts["completed"]/Result["uptime_s"] if Result["uptime_s"]>0 else 0.0
+    Result["recent_throughput_per_s"] = sum(1 for i in Finished if i>now-ThroughputWindow)/min(ThroughputWindow,max(Result["uptime_s"],1e-9))
+    return Result
+
+"""
+The request handler. Each request gets its own thread, which hands the conversion to the worker pool and waits for the answer.
+"""
+class ConversionHandler(http.server.BaseHTTPRequestHandler):
+    """
+    This function sends an answer. It takes the HTTP status, the content type, and the body (bytes), plus any extra headers.
+    """
+    def Reply(self,status,ContentType,body,**headers):
+        self.send_response(status)
+        self.send_header("Content-Type",ContentType)
+        self.send_header("Content-Length",str(len(body)))
+        for name,value in headers.items():
+            self.send_header(name.replace("_","-"),value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    """
+    This function sends a dictionary as a JSON answer
+    """
+    def ReplyJSON(self,status,Result,**headers):
+        self.Reply(status,"application/json",json.dumps(Result).encode("utf-8"),**headers)
+
+    """
+    GET only answers /metrics
+    """
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path=="/metrics":
+            self.ReplyJSON(200,Metrics(self.server))
+        else:
+            self.ReplyJSON(404,{"error":"not found"})
+
+    """
+    POST only answers /convert
+    """
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path!="/convert":
+            self.ReplyJSON(404,{"error":"not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length",""))
+        except ValueError:
+            self.ReplyJSON(411,{"error":"Content-Length is needed"})
+            return
+        if length<0: #read(-1) would read until the client hangs up, past the upload limit
+            self.ReplyJSON(400,{"error":"Content-Length can't be negative"})
+            return
+        if length>self.server.maxupload:
+            self.ReplyJSON(413,{"error":"the image file is bigger than %d bytes" % self.server.maxupload})
+            return
+        Query = urllib.parse.parse_qs(url.query)
+        try:
+            Options = RequestOptions(Query)
+            Tracks = int(Query.get("tracks",[35])[-1]) if Query.get("format",[""])[-1].lower()=="dsk" else None
+            if Tracks is not None and Tracks not in CoCo3Disk.DiskTracks:
+                raise ValueError("tracks must be one of: "+", ".join(str(i) for i in CoCo3Disk.DiskTracks))
+        except ValueError as err:
+            self.ReplyJSON(400,{"error":str(err)})
+            return
+        server = self.server
+        if not server.slots.acquire(blocking=False): #backpressure: everything is busy, so turn the request away before reading its body
+            with server.lock:
+                server.counts["rejected"]+=1
+            self.ReplyJSON(503,{"error":"server busy"},Retry_After=str(RetryAfter))
+            return
+        start = time.monotonic()
+        with server.lock:
+            server.inflight+=1
+        executor = server.executor
+        try:
+            data = self.rfile.read(length)
+            Result = executor.submit(ConvertRequest,data,Query.get("name",["IMAGE"])[-1],Options,Tracks,server.cachedir,server.cachesize).result()
+            failed = None
+        except concurrent.futures.process.BrokenProcessPool as err:
+            failed = err
+            RestartWorkers(server,executor)
+        except Exception as err:
+            failed = err
+        finally:
+            server.slots.release()
+            with server.lock:
+                server.inflight-=1
+                server.counts["failed" if failed else "completed"]+=1
+                server.latencies.append(time.monotonic()-start)
+                server.finished.append(time.monotonic())
+        if isinstance(failed,concurrent.futures.process.BrokenProcessPool):
+            self.ReplyJSON(500,{"error":"a worker process died, the workers have been restarted"})
+        elif failed:
+            self.ReplyJSON(400 if BadInput(failed) else 500,{"error":str(failed)})
+        elif Tracks:
+            self.Reply(200,"application/octet-stream",Result)
+        else:
+            name,truncname,fileImages,BASText = Result
+            self.ReplyJSON(200,{"name":name,"truncname":truncname,"bas":BASText,"bin":[base64.b64encode(i).decode("ascii") for i in fileImages]})
+
+    def log_message(self,format,*args): #keep quiet unless asked, a build can send a lot of requests
+        if self.server.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self,format,*args)
+
+"""
+This function creates the server. It takes the host and port to listen on, the number of worker processes (None uses all of the cores), the
+number of requests that can wait for a worker, the cache directory (or None), the cache size limit, whether to log every request, and the biggest
+request body taken, in bytes. The worker processes are started and warmed up before it returns.
+"""
+def MakeServer(Host="127.0.0.1",Port=DefaultPort,Workers=None,MaxQueue=DefaultQueue,CacheDir=None,CacheSize=CoCo3Cache.DefaultCacheSize,Verbose=False,
+               MaxUpload=DefaultMaxUpload):
+    server = http.server.ThreadingHTTPServer((Host,Port),ConversionHandler)
+    server.daemon_threads = True
+    server.workers = Workers or os.cpu_count() or 1
+    server.maxqueue = MaxQueue
+    server.maxupload = MaxUpload
+    server.executor = StartWorkers(server.workers)
+    server.slots = threading.BoundedSemaphore(server.workers+MaxQueue)
+    server.lock = threading.Lock()
+    server.restartlock = threading.Lock()
+    server.inflight = 0
+    server.counts = {"completed":0,"failed":0,"rejected":0,"restarts":0}
+    server.latencies = collections.deque(maxlen=LatencyWindow)
+    server.finished = collections.deque(maxlen=LatencyWindow)
+    server.started = time.monotonic()
+    server.cachedir = CacheDir
+    server.cachesize = CacheSize
+    server.verbose = Verbose
+    return server
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a local server that converts images to CoCo 3 HSCREEN .BIN files and .BAS programs.")
+    parser.add_argument("--host",default="127.0.0.1",help="address to listen on [default: %(default)s]")
+    parser.add_argument("--port",type=int,default=DefaultPort,help="port to listen on [default: %(default)d]")
+    parser.add_argument("-j","--jobs",type=I2C.PositiveInt,help="number of worker processes [default: all cores]")
+    parser.add_argument("--queue",type=int,default=DefaultQueue,help="number of requests that can wait for a worker [default: %(default)d]")
+    parser.add_argument("--cache",nargs="?",const=CoCo3Cache.DefaultCacheDir,help="reuse conversions from the cache in this directory [default: "+CoCo3Cache.DefaultCacheDir+"]")
+    parser.add_argument("--cache-size",type=float,default=CoCo3Cache.DefaultCacheSize/2**20,help="size limit of the cache in MB [default: %(default)g]")
+    parser.add_argument("--max-upload",type=float,default=DefaultMaxUpload/2**20,help="biggest image file taken, in MB [default: %(default)g]")
+    parser.add_argument("-v","--verbose",action="store_true",help="log every request")
+    args = parser.parse_args()
+    server = MakeServer(args.host,args.port,args.jobs,args.queue,args.cache,int(args.cache_size*2**20),args.verbose,int(args.max_upload*2**20))
+    print("Listening on http://%s:%d/ with %d workers" % (args.host,args.port,server.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown()
@@ -8,28 +8,48 @@ Last Modified Thu May 28, 2019
 This script will take an arbitrary image in just about any standard format, of any size and aspect ratio, and convert it to be viewable on a CoCo 3
 using the HSCREEN 2 (320x192, 16 color) graphics mode. NOTE: the image file must be in the same directory as this python script for the script to
 operate correctly. I do not have any path handling. The program scales the image to fit on HSCREEN 2, asking for stretch and/or positioning info
-if the image has a different aspect ratio than the screen. It then dithers the image using a 16 color subset of the CoCo 3 color palette. Then it 
-outputs four .BIN files (one for each 8kB bank required for an HSCREEN 2 screen), and a Super ECB BASIC program which is suitable for loading and 
-displaying the image. The .BAS program includes the PALETTE needed for proper display of the image, and is commented to make it easier to 
-understand what it is doing. 
-
-To create a .DSK image suitable for loading on the CoCo, if you are using Windows, you can just drag and drop the .BAS program onto the 
-"makedisk.bat" batch file that should be included with this distribution, assuming that all of the files are in the same directory as the ToolShed 
-"decb.exe" utility. A similar script could easily be constructed for a Linux or Mac system.  I originally wrote the script in order to create a 
-fancy title screen for a game I was writing, so I didn't add a lot of bells and whistles to the load/display program. Since each image is 32kB, 
-four separate images could be saved on one 35 track disk image if desired (or more on a larger disk image), and the .BAS file could easily be 
+if the image has a different aspect ratio than the screen. It then dithers the image using a 16 color subset of the CoCo 3 color palette. Then it
+outputs four .BIN files (one for each 8kB bank required for an HSCREEN 2 screen), and a Super ECB BASIC program which is suitable for loading and
+displaying the image. The .BAS program includes the PALETTE needed for proper display of the image, and is commented to make it easier to
+understand what it is doing. The other high resolution modes (HSCREEN 1, 3 and 4, with 2 or 4 colors) can be picked too (see CCModes), and
+the images that look fine with fewer colors take only half or a quarter of the space.
+
+To create a .DSK image suitable for loading on the CoCo, if you are using Windows, you can just drag and drop the .BAS program onto the
+"makedisk.bat" batch file that should be included with this distribution, assuming that all of the files are in the same directory as the ToolShed
+"decb.exe" utility. On any system, "python CoCo3Disk.py MYPIC.BAS" does the same thing without ToolShed.  I originally wrote the script in order to create a
+fancy title screen for a game I was writing, so I didn't add a lot of bells and whistles to the load/display program. Since each image is 32kB,
+four separate images could be saved on one 35 track disk image if desired (or more on a larger disk image), and the .BAS file could easily be
 modified to load any of the images from a selection menu, or even cycle through the images like a slideshow. Feel free to modify it as you see fit.
 
+If the script is run with no arguments, it asks for all of its settings with prompts, just like it always has. If it is given image files,
+directories, or glob patterns on the command line, it runs in batch mode instead: every setting comes from the command line flags (or a JSON
+options file), and the images are converted in parallel on all of the available cores. Run it with --help to see the flags.
+
 Values for color palettes on CoCo were found here:
     http://exstructus.com/blog/2017/coco3-colour-palette/
 """
 from PIL import Image
-import struct
-from operator import add
-from numpy import inf
+import numpy as np
+import CoCo3Dither
+import CoCo3Disk
+import CoCo3Cache
+import CoCo3Profile
+import CoCo3Compress
+import argparse
+import concurrent.futures
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import hashlib
+import string
+import unicodedata
 
 """
-This function takes a dictionary (Choices), and a string (Question) as inputs. For the dictionary, the keys are the selection choices, and the 
+This function takes a dictionary (Choices), and a string (Question) as inputs. For the dictionary, the keys are the selection choices, and the
 definitions are a 2-tuple. The first value in the 2-tuple is the return value for the menu, and the second value is a description of the choice.
 The string is the prompt question that is displayed asking the user for input.
 """
@@ -43,7 +63,7 @@ def MenuChoice(Choices,Question):
                 maxlen=len(entry)
         tabs = int(1.0*(maxlen+1)/tablen)+1
         print()
-        for entry in options: 
+        for entry in options:
             tabsentry = int(1.0*(len(entry)+1)/tablen)
             space = ":"+"\t"*(tabs-tabsentry)
             print (entry+space+ Choices[entry][1])
@@ -60,6 +80,17 @@ CCMaxH = 192
 CCPalSize = 16
 CCRatio = 1.0*CCMaxH/CCMaxW
 
+"""
+Dictionary of the CoCo 3 high resolution graphics modes. The keys are the HSCREEN mode numbers, and the definitions are a 4-tuple of the width,
+height, number of bits per pixel, and a description. Each mode has 2**bits palette slots. Every mode keeps its screen in the 8kB banks starting
+at bank &H30, one row after the other with no gaps, and the leftmost pixel of each byte in its highest bits. The screen is always the same size on
+the monitor, so the pixels of the 640 wide modes are half as wide as the others.
+"""
+CCModes = {1:(320,192,2,"320x192, 4 colors"),
+           2:(320,192,4,"320x192, 16 colors (recommended)"),
+           3:(640,192,1,"640x192, 2 colors"),
+           4:(640,192,2,"640x192, 4 colors")}
+
 """
 Python list with the lines used in the BASIC CoCo display program. This is mostly a copy from "300 Peeks, Pokes, and Execs for the CoCo 3".
 It is corrected for a missing "NEXT" statement and commented. Once the name and palette are found, this will be exported into a .BAS file.
@@ -67,276 +98,847 @@ It is corrected for a missing "NEXT" statement and commented. Once the name and
 CCDispProg = ["""10 POKE 65497,0'SPEED UP""","""20 CLEAR 200,&H6000'SET MEM LOC TO START DATA LOAD""",'30 A$="','"',"""40 FOR H=1TO4'LOOP THROUGH 4 IMAGE FILES""","""50 POKE &HFFA3,48+H-1'SET MEM BANK FOR APPROPRIATE FILE""","""60 LOADM A$+STR$(H)'LOAD IMAGE FILE""",'70 NEXT',"""80 POKE &HFFA3,123'GO BACK TO ORIGINAL MEM BANK""","""90 CLEAR 200,&H7FFF'RESET TOP OF BASIC""","""100 POKE &HE6C6,18:POKE &HE6C7,18'DISABLE HCLS DURING HSCREEN""","""120 FOR S=0TO15'LOOP THROUGH PALETTE SLOTS""","""130 READ C'LOAD COLOR FOR THAT SLOT""","""140 PALETTE S,C'STORE COLOR IN SLOT""",'150 NEXT',"""160 HSCREEN 2'DISPLAY THE IMAGE""","""170 A$=INKEY$:IF A$="" THEN 170'WAIT FOR KEYPRESS TO EXIT""","""175 RGB:POKE 65496,0'RESET PALETTE, SLOW DOWN AND EXIT""",'180 DATA ']
 
 """
-Useful constants for processing BMP files. 
-BytesPerPalette is B,G,R, and a zero byte
-The 9 BMP HeadVals are "BM", File Size, Reserved, DataStart, HeaderSize, W, H, Planes, bpp
-LHead is the head size in bytes
-Offset is used to get to the right spot in the file after extracting the 9 HeadVals in the struct
+CoCo 3 color names and palette values for the two monitor types.
+The names are found in "CoCo 3 Secrets Revealed"
+The color palette values were found here at http://exstructus.com/blog/2017/coco3-colour-palette/
 """
-bitsPerByte = 8
-BytesPerPalette = 4
-HeadVals = 9
-BMPHeaderFormat="<2s6I2H"
-LHead = struct.calcsize(BMPHeaderFormat)
-Offset = LHead-HeadVals
+CCNamesRGB = ["Black","Dark Blue","Dark Green","Dark Cyan","Dark Red","Dark Magenta","Brown","Dark Grey","Medium Blue","Bright Blue","Light Blue/Cyan","Light Blue","Indigo","Medium Blue/Purple","Medium Sky Blue","Medium Peacock","Medium Green","Medium Green/Cyan","Bright Green","Medium Yellow/Green","Light Yellow/Green","Light Green/Cyan","Bright Yellow/Green","Light Green","Pale Green/Cyan","Peacock","Light Green/Cyan","Bright Cyan","Light Peacock","Pale Peacock","Pale Green/Cyan","Light Cyan","Medium Red","Medium Red/Magenta","Yellow/Orange","Light Red","Bright Red","Light Red/Magenta","Orange","Pale Red/Magenta","Medium Blue/Magenta","Blue/Purple","Light Magenta","Purple","Light Purple","Bright Magenta","Pale Blue/Magenta","Pale Purple","Medium Yellow","Light Yellow","Light Yellow/Green","Pale Yellow/Green","Light Yellow/Orange","Medium Yellow","Bright Yellow","Pale Yellow","Light Grey","Pale Blue","Pale Cyan","Pale Blue/Cyan","Pale Red","Pale Magenta","Very Pale Yellow","White"]
+R_CC_RGB = [0,0,0,0,85,85,85,85,0,0,0,0,85,85,85,85,0,0,0,0,85,85,85,85,0,85,0,0,85,85,85,85,170,170,170,170,255,255,255,255,170,170,170,170,255,255,255,255,170,170,170,170,255,255,255,255,170,170,170,170,255,255,255,255]
+G_CC_RGB = [0,0,85,85,0,0,85,85,0,0,85,85,0,0,85,85,170,170,255,255,170,170,255,255,170,255,255,255,170,170,255,255,0,0,85,85,0,0,85,85,0,0,85,85,0,0,85,85,170,170,255,255,170,170,255,255,170,170,255,255,170,170,255,255]
+B_CC_RGB = [0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255,0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255,0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255,0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255]
+CCNamesCMP = ["Black","Light Green/Cyan","Dark Green","Light Yellow/Green","Light Yellow","Brown","Light Red","Dark Red","Medium Red/Magenta","Dark Magenta","Medium Sky Blue","Indigo","Dark Blue","Light Blue/Cyan","Dark Cyan","Light Peacock","Dark Grey","Medium Green/Cyan","Bright Green","Bright Yellow/Green","Medium Yellow","Yellow/Orange","Medium Red","Light Red/Magenta","Light Purple","Medium Blue/Magenta","Light Magenta","Medium Blue/Purple","Medium Blue","Light Blue","Pale Green/Cyan","Light Green/Cyan","Light Grey","Medium Yellow/Green","Medium Green","Light Yellow/Green","Bright Yellow","Light Yellow/Orange","Orange","Bright Red","Pale Blue/Magenta","Bright Magenta","Blue/Purple","Medium Peacock","Bright Blue","Peacock","Bright Cyan","Pale Green/Cyan","White","Pale Cyan","Light Green","Pale Yellow/Green","Pale Yellow","Medium Yellow","Pale Red/Magenta","Pale Red","Pale Purple","Pale Magenta","Purple","Pale Blue","Pale Peacock","Light Cyan","Pale Blue/Cyan","Very Pale Yellow"]
+R_CC_CMP = [0,14,12,21,51,86,108,118,113,92,61,21,1,5,12,13,50,29,49,86,119,158,179,192,186,165,133,94,23,16,23,25,116,74,102,142,179,219,243,252,251,230,198,155,81,61,52,57,253,137,161,189,215,240,253,253,251,237,214,183,134,121,116,255]
+G_CC_CMP = [0,78,69,53,33,4,1,1,12,24,31,35,37,51,67,77,50,149,141,123,103,77,55,39,35,43,53,63,100,119,137,148,116,212,204,186,164,137,114,97,88,89,96,109,156,179,199,211,253,230,221,207,192,174,158,148,143,144,150,162,196,212,225,255]
+B_CC_CMP = [0,20,18,14,10,10,12,19,76,135,178,196,148,97,29,20,50,38,36,32,28,25,24,78,143,207,248,249,228,174,99,46,116,58,52,48,44,41,68,132,202,250,250,250,251,243,163,99,254,104,83,77,82,105,142,188,237,251,251,251,252,240,183,255]
+
+"""
+Dictionary of the monitor types. The keys are the first letter of the monitor type, and the definitions are a 3-tuple. The first value is the
+list of color names, the second value is the list of (R,G,B) triplets for each Color Computer color, and the third value is the BASIC command
+used on line 175 of the display program to reset the palette on exit.
+"""
+CCMonitors = {"R":(CCNamesRGB,[i for i in zip(R_CC_RGB,G_CC_RGB,B_CC_RGB)],"RGB"),
+              "C":(CCNamesCMP,[i for i in zip(R_CC_CMP,G_CC_CMP,B_CC_CMP)],"CMP")}
 
 """
 Useful constants for the CoCo bin file format
 ImagefileHead (top of each file), and ImagefileFoot (bottom of each file) were extracted from the HSCREEN 2 graphics files saved from the CoCo 3
 using the save program found in "300 Peeks, Pokes, and Execs for the CoCo 3", and corrected to add the missing "NEXT" statement.
 The HSCREEN 2 screen has to be spread across 4 different 8KB banks, which is easiest to do by splitting it into 4 different bin files
-These four files each have a size of exactly 8KB, which is stored in LImageFileMax
-In addtion to the actual image data, an additional 2KB of zeros are tacked on to the bottom of the data to make it fit exactly into the 4 8KB banks
-Those extra zeros are stored in TailData, and TailColor and LTailData are used to create it
+These files each have a size of exactly 8KB, which is stored in LImageFileMax
+In addtion to the actual image data, pixels of TailColor are tacked on to the bottom of the data to make it fit exactly into whole 8KB banks
+(2KB for HSCREEN 2 and 4, which take 4 banks, and 1KB for HSCREEN 1 and 3, which take 2 banks)
 """
 ImagefileHead=b"\x00\x20\x00\x60\x00"
 ImagefileFoot=b"\xff\x00\x00\x00\x00"
 LImagefileMax = 8192
 TailColor = 0
-LTailData = 2048
-TailData = struct.pack('B',TailColor+(TailColor<<4))*LTailData
 
 """
-***************************************************************************************************************
-These are the input variables for using this script
-***************************************************************************************************************
+This function takes an HSCREEN mode number (see CCModes), and returns the number of 8KB banks (and so .BIN files) its screen takes
 """
-filename=input("""Please provide the filename of the image file.
-Note: 6 characters or less for the base of the name is best: """)
-while True:
-    Choice = input("Will you be displaying the picture on an (R)GB (recommended) or (C)MP monitor? ")
-    if Choice[0].upper()=="R":
-        #These names are found in "CoCo 3 Secrets Revealed"
-        CCNames = ["Black","Dark Blue","Dark Green","Dark Cyan","Dark Red","Dark Magenta","Brown","Dark Grey","Medium Blue","Bright Blue","Light Blue/Cyan","Light Blue","Indigo","Medium Blue/Purple","Medium Sky Blue","Medium Peacock","Medium Green","Medium Green/Cyan","Bright Green","Medium Yellow/Green","Light Yellow/Green","Light Green/Cyan","Bright Yellow/Green","Light Green","Pale Green/Cyan","Peacock","Light Green/Cyan","Bright Cyan","Light Peacock","Pale Peacock","Pale Green/Cyan","Light Cyan","Medium Red","Medium Red/Magenta","Yellow/Orange","Light Red","Bright Red","Light Red/Magenta","Orange","Pale Red/Magenta","Medium Blue/Magenta","Blue/Purple","Light Magenta","Purple","Light Purple","Bright Magenta","Pale Blue/Magenta","Pale Purple","Medium Yellow","Light Yellow","Light Yellow/Green","Pale Yellow/Green","Light Yellow/Orange","Medium Yellow","Bright Yellow","Pale Yellow","Light Grey","Pale Blue","Pale Cyan","Pale Blue/Cyan","Pale Red","Pale Magenta","Very Pale Yellow","White"]
-        #These color palette values were found here at http://exstructus.com/blog/2017/coco3-colour-palette/
-        R_CC = [0,0,0,0,85,85,85,85,0,0,0,0,85,85,85,85,0,0,0,0,85,85,85,85,0,85,0,0,85,85,85,85,170,170,170,170,255,255,255,255,170,170,170,170,255,255,255,255,170,170,170,170,255,255,255,255,170,170,170,170,255,255,255,255]
-        G_CC = [0,0,85,85,0,0,85,85,0,0,85,85,0,0,85,85,170,170,255,255,170,170,255,255,170,255,255,255,170,170,255,255,0,0,85,85,0,0,85,85,0,0,85,85,0,0,85,85,170,170,255,255,170,170,255,255,170,170,255,255,170,170,255,255]
-        B_CC = [0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255,0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255,0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255,0,85,0,85,0,85,0,85,170,255,170,255,170,255,170,255]
-        break
-    elif Choice[0].upper()=="C":
-        CCDispProg[17]="""175 CMP:POKE 65496,0'RESET PALETTE, SLOW DOWN AND EXIT"""
-        #These names are found in "CoCo 3 Secrets Revealed"
-        CCNames = ["Black","Light Green/Cyan","Dark Green","Light Yellow/Green","Light Yellow","Brown","Light Red","Dark Red","Medium Red/Magenta","Dark Magenta","Medium Sky Blue","Indigo","Dark Blue","Light Blue/Cyan","Dark Cyan","Light Peacock","Dark Grey","Medium Green/Cyan","Bright Green","Bright Yellow/Green","Medium Yellow","Yellow/Orange","Medium Red","Light Red/Magenta","Light Purple","Medium Blue/Magenta","Light Magenta","Medium Blue/Purple","Medium Blue","Light Blue","Pale Green/Cyan","Light Green/Cyan","Light Grey","Medium Yellow/Green","Medium Green","Light Yellow/Green","Bright Yellow","Light Yellow/Orange","Orange","Bright Red","Pale Blue/Magenta","Bright Magenta","Blue/Purple","Medium Peacock","Bright Blue","Peacock","Bright Cyan","Pale Green/Cyan","White","Pale Cyan","Light Green","Pale Yellow/Green","Pale Yellow","Medium Yellow","Pale Red/Magenta","Pale Red","Pale Purple","Pale Magenta","Purple","Pale Blue","Pale Peacock","Light Cyan","Pale Blue/Cyan","Very Pale Yellow"]
-        #These color palette values were found here at http://exstructus.com/blog/2017/coco3-colour-palette/
-        R_CC = [0,14,12,21,51,86,108,118,113,92,61,21,1,5,12,13,50,29,49,86,119,158,179,192,186,165,133,94,23,16,23,25,116,74,102,142,179,219,243,252,251,230,198,155,81,61,52,57,253,137,161,189,215,240,253,253,251,237,214,183,134,121,116,255]
-        G_CC = [0,78,69,53,33,4,1,1,12,24,31,35,37,51,67,77,50,149,141,123,103,77,55,39,35,43,53,63,100,119,137,148,116,212,204,186,164,137,114,97,88,89,96,109,156,179,199,211,253,230,221,207,192,174,158,148,143,144,150,162,196,212,225,255]
-        B_CC = [0,20,18,14,10,10,12,19,76,135,178,196,148,97,29,20,50,38,36,32,28,25,24,78,143,207,248,249,228,174,99,46,116,58,52,48,44,41,68,132,202,250,250,250,251,243,163,99,254,104,83,77,82,105,142,188,237,251,251,251,252,240,183,255]
-        break
-    else:
-        print("Invalid input!")        
-#creates a list of the (R,G,B) triplets for each Color Computer color
-CC_Colors = [i for i in zip(R_CC,G_CC,B_CC)]
-ColorNameChoices={}
-i=0
-for name in CCNames:
-    if i<10:
-        key="0"+str(i)
-    else:
-        key=str(i)
-    ColorNameChoices[key]=(CC_Colors[i],CCNames[i])
-    i+=1
-# open the source image, put it in RGB mode, and find its size and aspect ratio
-image = Image.open(filename)
-image = image.convert("RGB")
-(width,height) = image.size
-ratio = 1.0*height/width
-#If the image isn't the same aspect ratio as HSCREEN 2, tell the script how to position the image on HSCREEN 2
-VPosChoices = {"t":(0,"Top"),"c":(1,"Center"),"b":(2,"Bottom")}
-HPosChoices = {"l":(0,"Left"),"c":(1,"Center"),"r":(2,"Right")}
-HPos = 1 #0 = left, 1 = center, 2 = right
-VPos = 1 #0 = top, 1 = center, 2 = bottom
-Stretch = 0 # If this is 1, the image will be stretched to fill the screen
-while not(ratio==CCRatio):
-    Choice = input("""The image is not the same aspect ratio as the screen. 
-Do you want to strech the image to fill the screen? """)
-    if Choice[0].upper()=="Y":
-        HPos = 1 #0 = left, 1 = center, 2 = right
-        VPos = 1 #0 = top, 1 = center, 2 = bottom
-        Stretch = 1 # If this is 1, the image will be stretched to fill the screen
-        break
-    elif Choice[0].upper()=="N":
-        Stretch = 0
-        while True:
-            Choice1 = input("""Do you want to change the background color [default: black]? """)
-            if Choice1[0].upper()=="Y":
-                #Color used for the background color on the screen if the image doesn't fill the full screen
-                BackColor = MenuChoice(ColorNameChoices,"Select a background color from the list: ")
-                break
-            elif Choice1[0].upper()=="N":
-                #Color used for the background color on the screen if the image doesn't fill the full screen
-                BackColor = '#000000' 
-                break
+def ModeBanks(Mode):
+    Width,Height,Bits,Null = CCModes[Mode]
+    return -(-Width*Height*Bits//8//LImagefileMax)
+
+"""
+Nearest color lookup tables
+For a given set of CoCo colors, the lookup table holds the number of the nearest CoCo color for every one of the 2**24 possible (R,G,B) colors,
+one byte each, indexed by (R<<16)+(G<<8)+B. The table is built once, saved as a .npy file in NearestCacheDir (which can be set with the
+IMAGE2COCO3_CACHE environment variable), and memory-mapped from there the next time it is needed, so only the parts of it that are actually
+used get read from disk. NearestTables holds the tables already loaded by this process.
+"""
+NearestCacheDir = os.environ.get("IMAGE2COCO3_CACHE",os.path.join(os.path.expanduser("~"),".cache","Image2CoCo3"))
+NearestTables = {}
+
+"""
+This function takes the list of (R,G,B) triplets for the CoCo colors (CC_Colors), and returns a 256x256x256 array holding the number of the
+nearest CoCo color to each (R,G,B) color. Ties go to the lowest color number, just like the original palette matching loop.
+"""
+def BuildNearestTable(CC_Colors):
+    Colors = np.array(CC_Colors,dtype=np.int32)
+    levels = np.arange(256,dtype=np.int32)
+    #squared distance from every level of each of R, G, and B to that component of every CoCo color
+    dR,dG,dB = [(levels[:,None]-Colors[None,:,k])**2 for k in range(3)]
+    dGB = dG[:,None,:]+dB[None,:,:]
+    Table = np.empty((256,256,256),dtype=np.uint8)
+    for r in range(256): #one red level at a time, so only a 256x256x64 distance array is needed at once
+        Table[r] = (dGB+dR[r]).argmin(axis=2)
+    return Table
+
+"""
+This function takes the list of (R,G,B) triplets for the CoCo colors (CC_Colors), and returns its flattened nearest color lookup table.
+The table is loaded from NearestCacheDir if it is there, and built and saved there if it isn't. The file is written to a temporary name first,
+and then renamed, so batch worker processes that build the same table at the same time can't read a partly written file.
+"""
+def NearestTable(CC_Colors):
+    key = tuple(tuple(i) for i in CC_Colors)
+    if key in NearestTables:
+        return NearestTables[key]
+    digest = hashlib.sha1(np.array(key,dtype=np.uint8).tobytes()).hexdigest()[:16]
+    path = os.path.join(NearestCacheDir,"nearest_"+digest+".npy")
+    try:
+        Table = np.load(path,mmap_mode='r')
+    except (OSError,ValueError):
+        Table = BuildNearestTable(CC_Colors).reshape(-1)
+        try:
+            os.makedirs(NearestCacheDir,exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=NearestCacheDir,suffix=".tmp",delete=False) as outfile:
+                np.save(outfile,Table)
+            os.replace(outfile.name,path)
+        except OSError: #if the cache can't be written, just keep the table in memory
+            pass
+    NearestTables[key] = Table
+    return Table
+
+"""
+This function takes an array of (R,G,B) colors of any shape (the last axis must be R,G,B), and the list of (R,G,B) triplets for the CoCo
+colors (CC_Colors), and returns an array of the numbers of the nearest CoCo colors, with the shape of rgb minus its last axis.
+"""
+def Nearest(rgb,CC_Colors):
+    rgb = np.asarray(rgb).astype(np.intp)
+    return np.take(NearestTable(CC_Colors),(rgb[...,0]<<16)|(rgb[...,1]<<8)|rgb[...,2])
+
+"""
+Default conversion options. These are the same values the interactive prompts use when the image already has the HSCREEN 2 aspect ratio.
+Monitor is "R" or "C", Stretch is 1 to stretch the image to fill the screen, HPos is 0 = left, 1 = center, 2 = right, VPos is 0 = top,
+1 = center, 2 = bottom, BackColor is the CoCo color number used for the background if the image doesn't fill the full screen, Dither is the
+dither mode (see CoCo3Dither.DitherModes), Serpentine is 1 to use a serpentine scan for the error diffusion dither modes, and Mode is the
+HSCREEN mode number (see CCModes), and Compress is 1 to write compressed .BIN files that the .BAS program unpacks (see CoCo3Compress).
+"""
+DefaultOptions = {"Monitor":"R","Stretch":0,"HPos":1,"VPos":1,"BackColor":0,"Dither":"pil","Serpentine":0,"Mode":2,"Compress":0}
+
+"""
+This function takes a list of CoCo color names (CCNames), and the list of (R,G,B) triplets (CC_Colors), and returns a dictionary suitable for
+use with MenuChoice. The keys are the two digit color numbers, and the definitions are a 2-tuple of the (R,G,B) triplet and the color name.
+"""
+def ColorChoices(CCNames,CC_Colors):
+    ColorNameChoices={}
+    i=0
+    for name in CCNames:
+        if i<10:
+            key="0"+str(i)
+        else:
+            key=str(i)
+        ColorNameChoices[key]=(CC_Colors[i],CCNames[i])
+        i+=1
+    return ColorNameChoices
+
+"""
+The characters that the CoCo names are made of. Anything else in an image filename is a problem for DECB (dots, for one) or for the A$="..."
+line of the .BAS program (quotes, for one), so accents are taken off letters, and any other character becomes DECBFiller. DefaultName is used
+when nothing is left of the filename.
+"""
+DECBChars = set(string.ascii_uppercase+string.digits+"_-")
+DECBFiller = "_"
+DefaultName = "IMAGE"
+
+"""
+This function takes an image filename, and returns a 2-tuple of the useful variations of the filename used for saving the various files needed.
+The first value is the name used for the .BAS file (8 characters max), and the second value is the name used for the .BIN files (6 characters max).
+Both are valid DECB filenames (see DECBChars).
+"""
+def FileNames(filename):
+    name = os.path.basename(filename).split(".")[0]
+    name = "".join(i for i in unicodedata.normalize("NFKD",name) if not unicodedata.combining(i)).upper()
+    name = "".join(i if i in DECBChars else DECBFiller for i in name)[:8] or DefaultName
+    truncname = name[:6]
+    return name,truncname
+
+"""
+This function takes a list of image filenames that are all written to the same place, and returns a list of the 2-tuples from FileNames for
+them, changed where needed so that no two images get the same .BAS name or the same .BIN name. The first image keeps its names, and each one
+after it that would clash gets a number on the end of its .BIN name (2, 3, and so on), which is then used for its .BAS name too. Clashes are
+found after FileNames has made the names DECB safe, so "café.png" and "cafe.png" get different names.
+"""
+def UniqueNames(filenames):
+    Names = []
+    UsedBAS = set()
+    UsedBIN = set()
+    for filename in filenames:
+        name,truncname = FileNames(filename)
+        number = 1
+        while name in UsedBAS or truncname in UsedBIN:
+            number+=1
+            truncname = FileNames(filename)[1][:6-len(str(number))]+str(number)
+            name = truncname
+        UsedBAS.add(name)
+        UsedBIN.add(truncname)
+        Names.append((name,truncname))
+    return Names
+
+"""
+This function takes the list of (R,G,B) triplets for the CoCo colors (CC_Colors), and returns a PIL palette image that holds those colors.
+This is what the image is quantized against to limit it to the colors available on the CoCo.
+"""
+def PaletteImage(CC_Colors):
+    #Combined Palette, with full 256*3 palette used by PIL
+    #flatten the 64 RGB triplets into a single list
+    CCcomb =[]
+    for i in CC_Colors:
+        CCcomb.extend(i)
+    #pad with zeros to the full 256*3 length
+    CCcomb+= [0, ] * (256-len(CC_Colors)) * 3
+    # a palette image used to store the CoCo colors
+    pimage = Image.new("P", (1, 1), 0)
+    pimage.putpalette(CCcomb)
+    return pimage
+
+"""
+This function takes an RGB PIL image, and fits it onto the screen of HSCREEN mode Mode. If Stretch is 1, the image is stretched to fill the screen.
+Otherwise the image aspect ratio is maintained, and the image is placed on a screen sized image filled with BackColor, at the position
+given by HPos (0 = left, 1 = center, 2 = right) and VPos (0 = top, 1 = center, 2 = bottom). It returns the screen sized RGB image (CCMaxW x
+CCMaxH for HSCREEN 2). If the image was made smaller when it was opened (see OpenImage), SourceSize is its size before that, so the aspect
+ratio comes out exactly the same.
+"""
+def FitImage(image,Stretch,HPos,VPos,BackColor,Mode=2,SourceSize=None):
+    ScreenW,ScreenH = CCModes[Mode][:2]
+    #Resize the image to fit on the screen, maintaining the image aspect ratio
+    image = image.resize(FittedSize(*(SourceSize or image.size),Stretch,Mode),Image.LANCZOS)
+    #Store the size of the resized image
+    (width,height) = image.size
+    #if the image aspect ratio doesn't match the screen aspect ratio, find the offsets to place the image on the screen based on the two inputs HPos and VPos
+    #Then create an image file filled with BackColor, and the paste the image into this image at the appropriate offset location
+    if Stretch==0 and not(width==ScreenW and height==ScreenH):
+        if width==ScreenW:
+            HOff = 0
+            if VPos == 0:
+                VOff = 0
+            elif VPos == 1:
+                VOff = int((ScreenH-height)/2)
             else:
-                print("Invalid input!")        
-        if ratio < CCRatio:
-            HPos = 1 #0 = left, 1 = center, 2 = right
-            VPos = MenuChoice(VPosChoices,"How would you like to position the image on the screen? ")
+                VOff = ScreenH-height
         else:
-            VPos = 1 #0 = left, 1 = center, 2 = right
-            HPos = MenuChoice(HPosChoices,"How would you like to position the image on the screen? ")
-        break
-    else:
-        print("Invalid input!")
-while True:
-    Choice = input("""Dithering (recommended) interleaves colors from the available palette to approximate other colors. 
-Do you want to dither the image to match the colors more closely? """)
-    if Choice[0].upper()=="Y":
-        ditherValue = Image.FLOYDSTEINBERG
-        break
-    elif Choice[0].upper()=="N":
-        ditherValue = Image.NONE
-        break
-    else:
-        print("Invalid input!")        
-"""
-***************************************************************************************************************
-"""
-
-#useful variations of the filename used for saving the various files needed
-name = filename.split(".")[0]
-name = name.upper()[:8]
-truncname = name[:6]
-
-#Combined Palette, with full 256*3 palette used by PIL
-#flatten the 64 RGB triplets into a single list
-CCcomb =[]
-for i in CC_Colors:
-    CCcomb.extend(i)
-
-#pad with zeros to the full 256*3 length
-CCcomb+= [0, ] * 192 * 3 
-
-#The following lines are used to import the image file, and convert it to an 320x192x16color image based on the available CoCo colors
-# a palette image used to store the CoCo colors
-pimage = Image.new("P", (1, 1), 0)
-pimage.putpalette(CCcomb)
-#Resize the image to fit on HSCREEN 2, maintaining the image aspect ratio
-if Stretch==1:
-    image = image.resize((CCMaxW,CCMaxH),Image.ANTIALIAS)
-elif ratio<CCRatio:
-    image = image.resize((CCMaxW,int(ratio*CCMaxW)),Image.ANTIALIAS)
-else:
-    image = image.resize((int(CCMaxH/ratio),CCMaxH),Image.ANTIALIAS)
-#Store the size of the resized image
-(width,height) = image.size
-#if the image aspect ratio doesn't match HSCREEN 2 aspect ratio, find the offsets to place the image on HSCREEN 2 based on the two inputs HPos and VPos
-#Then create an image file filled with BackColor, and the paste the image into this image at the appropriate offset location
-if Stretch==0 and not(width==CCMaxW and height==CCMaxH):
-    if width==CCMaxW:
-        HOff = 0
-        if VPos == 0:
             VOff = 0
-        elif VPos == 1:
-            VOff = int((CCMaxH-height)/2)
-        else:
-            VOff = CCMaxH-height
+            if HPos == 0:
+                HOff = 0
+            elif HPos == 1:
+                HOff = int((ScreenW-width)/2)
+            else:
+                HOff = ScreenW-width
+        image2 = image
+        image = Image.new("RGB",(ScreenW,ScreenH),BackColor)
+        image.paste(image2,(HOff,VOff))
+    return image
+
+"""
+This function takes the width and height of a source image, whether it will be stretched (Stretch), and the HSCREEN mode number, and returns the
+(width,height) that FitImage resizes it to
+"""
+def FittedSize(width,height,Stretch,Mode=2):
+    ScreenW,ScreenH = CCModes[Mode][:2]
+    XScale = ScreenW/CCMaxW #the 640 wide modes have pixels half as wide, so the image is spread across twice as many of them
+    ratio = 1.0*height/width
+    if Stretch==1:
+        return ScreenW,ScreenH
+    elif ratio<CCRatio:
+        return ScreenW,int(ratio*CCMaxW)
     else:
-        VOff = 0
-        if HPos == 0:
-            HOff = 0
-        elif HPos == 1:
-            HOff = int((CCMaxW-width)/2)
+        return int(XScale*CCMaxH/ratio),ScreenH
+
+"""
+Source image loading constants. Big photos are decoded at close to the size they are shown at, instead of at full size. ReduceGap is how many
+times bigger than the fitted size the image is kept for the final LANCZOS resize, which keeps the result almost the same as resizing the full
+size image. MaxDecodePixels caps the number of pixels decoded at once, which caps the memory a huge image can take (about 4 bytes a pixel).
+JPEG images can always be decoded at 1/2, 1/4 or 1/8 size, so only other formats can go over it.
+ReduceModes are the image modes Image.reduce works on; other modes (like palette images) are converted to RGB first.
+Orientations maps the EXIF orientation tag values to the transpose that turns the image upright (the same ones ImageOps.exif_transpose uses).
+"""
+ReduceGap = 2
+MaxDecodePixels = 1<<27
+ReduceModes = ["L","RGB","RGBA","CMYK"]
+Orientations = {2:Image.FLIP_LEFT_RIGHT,3:Image.ROTATE_180,4:Image.FLIP_TOP_BOTTOM,5:Image.TRANSPOSE,6:Image.ROTATE_270,7:Image.TRANSVERSE,
+                8:Image.ROTATE_90}
+ExifOrientation = 0x0112
+
+"""
+This function takes an opened PIL image, and returns its (width,height) once it is turned upright according to its EXIF orientation
+"""
+def OrientedSize(image):
+    if image.getexif().get(ExifOrientation,1) in (5,6,7,8): #turned a quarter turn
+        return image.size[::-1]
+    return image.size
+
+"""
+This function takes the bytes of an image file (data), whether it will be stretched (Stretch), and the HSCREEN mode number, and returns a
+2-tuple of the upright RGB image, made smaller to about ReduceGap times the size FitImage will resize it to, and the upright size of the source
+image (to pass to FitImage). JPEG images are decoded straight at the smaller size (draft mode), and everything else is decoded and then shrunk
+with Image.reduce, before the turn and the conversion to RGB, so those only ever work on the small image.
+"""
+def OpenImage(data,Stretch=0,Mode=2):
+    image = Image.open(io.BytesIO(data))
+    Orientation = image.getexif().get(ExifOrientation,1)
+    SourceSize = OrientedSize(image)
+    fitted = FittedSize(*SourceSize,Stretch,Mode)
+    if 0 in fitted:
+        raise ValueError("Image is too %s to fit the screen (%dx%d)" % (("narrow" if fitted[0]==0 else "short",)+SourceSize))
+    need = tuple(ReduceGap*i for i in fitted)
+    if Orientation in (5,6,7,8):
+        need = need[::-1] #the image is still on its side until it is turned
+    image.draft("RGB",need) #only JPEG does anything with this
+    if image.size[0]*image.size[1]>MaxDecodePixels:
+        raise ValueError("Image is too big to decode (%dx%d)" % image.size)
+    if image.mode not in ReduceModes:
+        image = image.convert("RGB")
+    factor = min(image.size[0]//need[0],image.size[1]//need[1])
+    if factor>=2:
+        image = image.reduce(factor)
+    if Orientation in Orientations:
+        image = image.transpose(Orientations[Orientation])
+    return image.convert("RGB"),SourceSize
+
+"""
+Palette selection uses a color histogram of the image with HistBits bits per color component (a 16x16x16 histogram). Each bin that is used
+is represented by the average color of the pixels that fall in it. MaxSwapPasses limits the number of local search passes.
+"""
+HistBits = 4
+MaxSwapPasses = 50
+
+"""
+This function takes an RGB PIL image, and returns its color histogram as a 2-tuple. The first value is an array of the number of pixels in each
+histogram bin, and the second value is an array of the (R,G,B) sums of the pixels in each bin. Histograms of several images (the frames of an
+animation, for example) can simply be added together.
+"""
+def ColorHistogram(image):
+    pixels = np.asarray(image,dtype=np.int64).reshape(-1,3)
+    shift = 8-HistBits
+    bins = ((pixels[:,0]>>shift)<<(2*HistBits))|((pixels[:,1]>>shift)<<HistBits)|(pixels[:,2]>>shift)
+    counts = np.bincount(bins,minlength=1<<(3*HistBits))
+    sums = np.stack([np.bincount(bins,weights=pixels[:,k],minlength=1<<(3*HistBits)) for k in range(3)],axis=1)
+    return counts,sums
+
+"""
+This function takes a color histogram (see ColorHistogram), the list of (R,G,B) triplets for the CoCo colors (CC_Colors), and the number of
+palette slots (PalSize), and returns the list of the PalSize CoCo color numbers that best represent the image. These go straight into the DATA
+line of the .BAS program.
+The cost of a palette is the total squared distance from every pixel to its nearest palette color, worked out on the histogram bins rather than
+the pixels. The palette is built greedily, adding whichever CoCo color lowers the cost the most, and then improved by swapping a palette color for
+a color that isn't in the palette for as long as that lowers the cost (the k-medoids swap step).
+"""
+def SelectPalette(Histogram,CC_Colors,PalSize=CCPalSize):
+    counts,sums = Histogram
+    used = np.nonzero(counts)[0]
+    means,counts = sums[used]/counts[used,None],counts[used] #each bin that is used is represented by the average color of its pixels
+    Colors = np.array(CC_Colors,dtype=np.float64)
+    #weighted distance from every histogram bin to every CoCo color, so the cost of a palette is just a sum of row minimums
+    dist = np.maximum((means**2).sum(axis=1)[:,None]-2*means@Colors.T+(Colors**2).sum(axis=1)[None,:],0)*counts[:,None]
+    #a CoCo color that is an exact copy of an earlier one is never used, so the palette doesn't waste a slot on it
+    Excluded = np.zeros(len(Colors),dtype=bool)
+    Excluded[[i for i in range(len(CC_Colors)) if tuple(CC_Colors[i]) in [tuple(j) for j in CC_Colors[:i]]]] = True
+    nearest = np.full(len(means),np.inf)
+    CCPal = []
+    for i in range(PalSize):
+        costs = np.minimum(nearest[:,None],dist).sum(axis=0) #the cost of the palette with each CoCo color added to it
+        costs[Excluded] = np.inf
+        best = int(costs.argmin())
+        CCPal.append(best)
+        Excluded[best] = True
+        nearest = np.minimum(nearest,dist[:,best])
+    cost = nearest.sum()
+    rows = np.arange(len(means))
+    slots = np.arange(PalSize)
+    for i in range(MaxSwapPasses):
+        Sel = dist[:,CCPal]
+        order = np.argpartition(Sel,1,axis=1)[:,:2] #the nearest and second nearest palette slots for each bin
+        first = Sel[rows,order[:,0]]
+        second = Sel[rows,order[:,1]]
+        #what each bin saves if a CoCo color is added to the palette
+        gain = np.maximum(first[:,None]-dist,0)
+        #the extra change for a bin whose nearest slot is swapped out: it falls back to the second nearest slot or the added color
+        loss = np.minimum(dist,second[:,None])-first[:,None]+gain
+        #delta[slot,color] is the change in cost from swapping that palette slot for that CoCo color, for every swap at once
+        delta = (order[:,0]==slots[:,None]).astype(np.float64)@loss-gain.sum(axis=0)
+        delta[:,Excluded] = np.inf
+        slot,best = np.unravel_index(int(delta.argmin()),delta.shape)
+        if delta[slot,best]>=-cost*1e-9: #stop once no swap makes a real improvement
+            break
+        Excluded[CCPal[slot]] = False
+        Excluded[best] = True
+        CCPal[slot] = int(best)
+        cost += delta[slot,best]
+    return CCPal
+
+"""
+This function takes the fitted RGB image, the list of (R,G,B) triplets for the CoCo colors (CC_Colors), the dither mode (Dither), and
+whether to use a serpentine scan (Serpentine), and returns a 2-tuple of a palettized image that uses the best PalSize color subset of the CoCo
+colors, and the list of the CoCo color numbers in its palette slots (to pass on to EncodeScreen). If the list of CoCo color numbers for the
+palette (CCPal) is given, that palette is used instead of picking one for this image.
+"""
+def QuantizeImage(image,CC_Colors,Dither,Serpentine=0,CCPal=None,PalSize=CCPalSize):
+    #find the best palette to represent this image
+    if CCPal is None:
+        CCPal = SelectPalette(ColorHistogram(image),CC_Colors,PalSize)
+    Colors = [CC_Colors[i] for i in CCPal]
+    if Dither=="pil":
+        #the palette image repeats the colors to fill all 256 slots, so whichever slot PIL picks, its number mod the palette size is the right palette slot
+        pixels = np.asarray(image.quantize(palette=PaletteImage(Colors*(256//len(Colors))),dither=Image.FLOYDSTEINBERG))%len(Colors)
+    else:
+        pixels = CoCo3Dither.DitherImage(np.asarray(image,dtype=np.float64),Colors,Dither,Serpentine==1)
+    imagep = Image.fromarray(pixels.astype(np.uint8),"P")
+    imagep.putpalette([k for color in Colors for k in color])
+    return imagep,CCPal
+
+"""
+This function takes a 2D array of palette slot numbers (one per pixel, each less than 2**Bits), and the number of bits per pixel (1, 2, 4 or 8),
+and returns the 2D array of packed bytes. Each row is packed separately, with the leftmost pixel in the highest bits of each byte, which is
+how every CoCo 3 graphics mode lays out its pixels.
+"""
+def PackPixels(pixels,Bits):
+    PerByte = 8//Bits
+    H,W = pixels.shape
+    shifts = (Bits*np.arange(PerByte-1,-1,-1)).astype(np.uint8)
+    #line up the pixels that go in each byte along a new last axis, shift each one into its place, and combine them
+    return np.bitwise_or.reduce(pixels.reshape(H,W//PerByte,PerByte).astype(np.uint8)<<shifts,axis=2)
+
+"""
+This function takes a palettized PIL image (imagep) that is exactly the size of the screen for HSCREEN mode Mode and uses no more palette slots
+than that mode has, plus the list of (R,G,B) triplets for the CoCo colors (CC_Colors), and returns a 2-tuple. The first value is the top-down,
+packed screen data (padded with TailColor to fill whole 8KB banks, see ModeBanks), and the second value is the list of CoCo color numbers for
+the palette slots. Everything is done in memory with numpy, so there is no need for a temporary BMP file.
+If the CoCo color numbers of the palette slots (CCPal) are already known, as they are from QuantizeImage, they are used just as they are.
+Otherwise they are worked out from the image palette with the nearest color lookup table.
+"""
+def EncodeScreen(imagep,CC_Colors,Mode=2,CCPal=None):
+    Width,Height,Bits,Null = CCModes[Mode]
+    PalSize = 1<<Bits
+    pixels = np.asarray(imagep,dtype=np.uint8) #one byte per pixel, rows already run top to bottom like the CoCo screen
+    ImageContent = PackPixels(pixels,Bits).tobytes()
+    #tack on bytes of TailColor pixels to complete the last bank
+    TailByte = PackPixels(np.full((1,8//Bits),TailColor),Bits).tobytes()
+    ImageContent += TailByte*(ModeBanks(Mode)*LImagefileMax-len(ImageContent))
+    if CCPal is not None:
+        return ImageContent,list(CCPal[:PalSize])+[0]*(PalSize-len(CCPal)) #a short palette is padded with black
+    #find the CoCo available color that best matches each of the first PalSize palette entries
+    Palette = np.array(imagep.getpalette()[:3*PalSize],dtype=np.int32).reshape(-1,3)
+    Palette = np.vstack((Palette,np.zeros((PalSize-len(Palette),3),dtype=np.int32))) #a short palette is padded with black, like the BMP palette was
+    CCPal = Nearest(Palette,CC_Colors).tolist()
+    return ImageContent,CCPal
+
+"""
+This function takes the screen data (ImageContent), and returns the list of the CoCo .BIN files that comprise the image, one per 8KB bank.
+If Compress is 1, each bank is compressed, and its .BIN file holds the unpacker too (see CoCo3Compress).
+"""
+def MakeBINFiles(ImageContent,Compress=0):
+    fileImages = []
+    for i in range(len(ImageContent)//LImagefileMax):
+        if Compress==1:
+            fileImage=CoCo3Compress.PackedBINFile(ImageContent[i*LImagefileMax:(i+1)*LImagefileMax])
         else:
-            HOff = CCMaxW-width
-    image2 = image
-    image = Image.new("RGB",(CCMaxW,CCMaxH),BackColor)
-    image.paste(image2,(HOff,VOff))
-#dither the image based on the CoCo available colors, and find the best 16 color palette to represent this image, then save the results to a BMP file
-if ditherValue==Image.FLOYDSTEINBERG:
-    imagep = image.quantize(palette=pimage)
-else:
-    imagep = image.convert(dither=ditherValue,palette=pimage)
-imagep = imagep.quantize(colors=CCPalSize)
-imagep.save(name+'.BMP')#NOTE: despite this only using 16 colors, a full 256 color palette is stored. The 16 colors used are in the first 16 slots, then padded with zeros
-
-#These lines load the BMPfile into a string called fileContent, and then extract the header data into a tuple called data
-with open(name+'.BMP', mode='rb') as file: # b is important -> binary
-    fileContent = file.read()
-L=len(fileContent)
-data=struct.unpack(BMPHeaderFormat+"B"*(L-LHead),fileContent)
-
-#This loads the important header data (DataStart=the byte where image data starts, W=image width in pixels, H=image height in pixels, and bpp=bits per pixel).
-Null,Null,Null,DataStart,Null,W,H,Null,bpp=data[:HeadVals]
-
-#Bpp is bytes per pixel representing the image. ImgRowWidth is the width in bytes of an image row, and LImage is the total length in bytes of the image data
-Bpp = 1.0*bpp/bitsPerByte
-ImgRowWidth = int(W*Bpp)
-LImage = H*ImgRowWidth
-
-"""
-BMP data starts at the bottom of the image and goes up by rows. CoCo image data starts at the top and goes down by rows
-The BMP file created from PIL uses a full byte per pixel, while a CoCo image only uses a nibble per pixel.
-This section reverses the row order, and crunches the bytes in the BMP down to nibbles, then packs them together again
-"""
-ImageContent = b""
-for row in range(H): #go through the data one row at a time
-    rowStart = DataStart+row*ImgRowWidth #find the start of the row data
-    rowData = fileContent[rowStart:rowStart+ImgRowWidth] #grab the row data
-    if bpp==8: #makes sure the BMP is actually stored as 8 bit color
-        A=list(struct.unpack('B'*len(rowData),rowData)) #unpack the row data as bytes in a list
-        B=list(map(add,[i<<4 for i in A[::2]],A[1::2])) #Shift the bits in the even bytes by 4 places, then add that to the odd bytes to pack two pixels into one byte
-        rowData = b''#clear the 1 Bpp row data
-        rowData =b"".join([struct.pack('B',i) for i in B]) #store the new 0.5 Bpp row data as a string
-    ImageContent = rowData+ImageContent #and put that row data at the top of the image
-ImageContent+=TailData #tack on the 2KB of zeros to complete the CoCo image data
-
-#This section creates the 4 CoCo .BIN files used that comprise the HSCREEN 2 image
-fileImages = []
-for i in range(4):
-    fileImage=ImagefileHead+ImageContent[i*LImagefileMax:(i+1)*LImagefileMax]+ImagefileFoot #grab the appropriate 8KB chunk of image data, and tack the CoCo image file header and footer to that data
-    fileImages.append(fileImage) #store that data in the list fileImages used for the image file data. This is not really needed, but could be used later for something...
-    with open(truncname+" "+str(i+1)+".BIN",'wb') as outfile: #open the .BIN file
-        outfile.write(fileImage) #and store the data there
-
-#These numbers are useful for finding the color vales for the CoCo Palette
-PaletteSize = 2**bpp #this is the palette size in the BMP, not the CoCo. Should be 256
-LPalette = BytesPerPalette*PaletteSize #This is the size in bytes of the BMP palette data
-PaletteStart = DataStart-LPalette-Offset #this is where the palette data starts in data
-Palette = data[PaletteStart:DataStart-Offset-1]#so this is the actual BMP palette
-
-#This loop extracts the R,G,and B values from the BMP palette into separate lists, ignoring the zero byte for each entry
-i=0
-R=[]
-G=[]
-B=[]
-for num in Palette:
-    if i%BytesPerPalette==0:
-        B.append(num)
-    elif (i-1)%BytesPerPalette==0:
-        G.append(num)
-    elif (i-2)%BytesPerPalette==0:
-        R.append(num)
-    i+=1
-
-#This zips the R,G,B values for each color into 3-tuples
-BMPPAL=[i for i in zip(R,G,B)]
-
-#This loop finds the CoCo available color that best matches each BMP Palette entry
-CCPal = []
-for color in BMPPAL: #for each BMP color
-    mindist=inf #initialize the best distance as infinity
-    i=0
-    bestslot = 64 #assign the initial best color as a non-existant CoCo color
-    for slot in CC_Colors: #go through each CoCo color
-        dist=(color[0]-slot[0])**2+(color[1]-slot[1])**2+(color[2]-slot[2])**2 #find how far BMP color is from CoCo color
-        if dist<mindist: #if it is closer than the current best, then it is the new best
-            bestslot = i #make the current color the best one
-            mindist = dist #set the current distance to the best distance
-        i+=1
-    CCPal.append(bestslot) #append the best color to the palette
+            fileImage=ImagefileHead+ImageContent[i*LImagefileMax:(i+1)*LImagefileMax]+ImagefileFoot #grab the appropriate 8KB chunk of image data, and tack the CoCo image file header and footer to that data
+        fileImages.append(fileImage) #store that data in the list fileImages used for the image file data
+    return fileImages
 
-#truncate the Palette at the 16 non-dummy colors
-CCPalTrunc = CCPal[:CCPalSize]
-#convert the palette color numbers into a string that is usable for the BASIC program
-PalStr = str(CCPalTrunc)[1:-1]
+"""
+This function takes a line of a BASIC program written for HSCREEN 2, and an HSCREEN mode number, and returns the line changed to suit that mode:
+the loop over the 4 .BIN files loops over that mode's banks, the loop over the 16 palette slots loops over that mode's slots, and the HSCREEN
+statement uses that mode
+"""
+def ModeLine(line,Mode):
+    Banks,PalSize = ModeBanks(Mode),1<<CCModes[Mode][2]
+    line = line.replace("1TO4","1TO"+str(Banks)).replace("THROUGH 4 ","THROUGH "+str(Banks)+" ")
+    return line.replace("0TO15","0TO"+str(PalSize-1)).replace("HSCREEN 2","HSCREEN "+str(Mode))
 
-#Now that the name and palette data are found, assemble the basic program into a text file
-with open(name+".BAS",'w+') as outfile:
+"""
+This function takes the name used for the .BIN files (truncname), the list of CoCo color numbers for the palette (CCPal), the monitor type
+("R" or "C"), the HSCREEN mode number, and whether the .BIN files are compressed (Compress), and returns the text of the BASIC display program
+"""
+def MakeBASProgram(truncname,CCPal,Monitor,Mode=2,Compress=0):
+    #truncate the Palette at the non-dummy colors
+    CCPalTrunc = CCPal[:1<<CCModes[Mode][2]]
+    #convert the palette color numbers into a string that is usable for the BASIC program
+    PalStr = str(CCPalTrunc)[1:-1]
+    BASText = ""
     for line in CCDispProg:
         if line=='30 A$="':
             line+=truncname
         elif line=='180 DATA ':
             line+=PalStr+'\r'
+        elif line.startswith('175 RGB'):
+            line=line.replace('RGB',CCMonitors[Monitor][2],1)+'\r'
+        elif Compress==1:
+            line=CoCo3Compress.LoaderLine(ModeLine(line,Mode))+'\r'
+        else:
+            line=ModeLine(line,Mode)+'\r'
+        BASText+=line
+    return BASText
+
+"""
+This function takes an image filename, and the dictionary of conversion options (see DefaultOptions), and does the whole conversion in memory.
+It returns a 4-tuple of the .BAS name, the .BIN name, the list of the .BIN file images, and the text of the .BAS program.
+If a cache directory (CacheDir) is given, the screen data and palette are looked up in the conversion cache first (see CoCo3Cache), and stored
+there after a miss. CacheSize is the size limit of the cache in bytes.
+If a dictionary is passed as Timings, the time (and peak memory) of each stage of the conversion is added to it (see CoCo3Profile).
+If Names (a 2-tuple of the .BAS name and the .BIN name) is given, those names are used instead of the ones made from the filename.
+"""
+def ConvertImage(filename,Options,CacheDir=None,CacheSize=CoCo3Cache.DefaultCacheSize,Timings=None,Names=None):
+    with CoCo3Profile.Stage(Timings,"read"):
+        with open(filename,'rb') as infile:
+            data = infile.read()
+    return ConvertData(data,filename,Options,CacheDir,CacheSize,Timings,Names)
+
+"""
+This function does the same thing as ConvertImage, but takes the bytes of the image file (data) instead of reading them from a file. The filename
+is only used to make the .BAS and .BIN names.
+"""
+def ConvertData(data,filename,Options,CacheDir=None,CacheSize=CoCo3Cache.DefaultCacheSize,Timings=None,Names=None):
+    CCNames,CC_Colors,Null = CCMonitors[Options["Monitor"]]
+    Mode = Options["Mode"]
+    Cached = None
+    if CacheDir is not None:
+        with CoCo3Profile.Stage(Timings,"cache"):
+            #Compress only changes how the .BIN files are written, so the same cache entry does for both
+            key = CoCo3Cache.CacheKey(data,{i:Options[i] for i in DefaultOptions if i!="Compress"})
+            Cached = CoCo3Cache.CacheGet(CacheDir,key)
+    if Cached is not None:
+        ImageContent,CCPal = Cached
+    else:
+        # open the source image at about the size it is needed, and put it in RGB mode
+        with CoCo3Profile.Stage(Timings,"decode"):
+            image,SourceSize = OpenImage(data,Options["Stretch"],Mode)
+        with CoCo3Profile.Stage(Timings,"fit"):
+            image = FitImage(image,Options["Stretch"],Options["HPos"],Options["VPos"],CC_Colors[Options["BackColor"]],Mode,SourceSize)
+        with CoCo3Profile.Stage(Timings,"palette"):
+            CCPal = SelectPalette(ColorHistogram(image),CC_Colors,1<<CCModes[Mode][2])
+        with CoCo3Profile.Stage(Timings,"dither"):
+            imagep,CCPal = QuantizeImage(image,CC_Colors,Options["Dither"],Options["Serpentine"],CCPal)
+        #pack the image into CoCo screen data, with the CoCo colors picked for the palette slots
+        with CoCo3Profile.Stage(Timings,"pack"):
+            ImageContent,CCPal = EncodeScreen(imagep,CC_Colors,Mode,CCPal)
+        if CacheDir is not None:
+            with CoCo3Profile.Stage(Timings,"cache"):
+                CoCo3Cache.CachePut(CacheDir,key,ImageContent,CCPal,CacheSize)
+    name,truncname = Names or FileNames(filename)
+    with CoCo3Profile.Stage(Timings,"bin"):
+        fileImages = MakeBINFiles(ImageContent,Options["Compress"])
+    with CoCo3Profile.Stage(Timings,"bas"):
+        BASText = MakeBASProgram(truncname,CCPal,Options["Monitor"],Mode,Options["Compress"])
+    return name,truncname,fileImages,BASText
+
+"""
+This function takes the output directory (outdir), and the 4-tuple returned by ConvertImage, and writes the .BIN files and the .BAS file
+"""
+def WriteOutputs(outdir,name,truncname,fileImages,BASText):
+    for i in range(len(fileImages)):
+        with open(os.path.join(outdir,truncname+" "+str(i+1)+".BIN"),'wb') as outfile: #open the .BIN file
+            outfile.write(fileImages[i]) #and store the data there
+    #Now that the name and palette data are found, save the basic program into a text file
+    with open(os.path.join(outdir,name+".BAS"),'w+',newline='') as outfile:
+        outfile.write(BASText)
+
+"""
+This function is what each batch worker process runs. It takes an image filename, the output directory (outdir), and the dictionary of
+conversion options, converts the image and writes its files. It returns a 6-tuple of the filename, True/False for success, the error message
+(or an empty string, or the compression report for compressed .BIN files), the time taken in seconds, the 4-tuple returned by ConvertImage, and the dictionary of stage timings. If outdir is None, no
+files are written, and the 4-tuple is what gets used (to build .DSK images, for example); otherwise it is None. The stage timings are only kept
+if Profile is True; otherwise they are None too. If ProfileMemory is True as well, tracemalloc runs during the conversion, so the stage timings
+hold the peak memory of each stage too (which makes the conversion a lot slower). Errors are caught here so that one bad image doesn't stop the
+whole batch. CacheDir, CacheSize and Names are passed along to ConvertImage.
+"""
+def ConvertFile(filename,outdir,Options,CacheDir=None,CacheSize=CoCo3Cache.DefaultCacheSize,Profile=False,Names=None,ProfileMemory=False):
+    start = time.perf_counter()
+    Timings = {} if Profile else None
+    try:
+        with CoCo3Profile.Tracing(Profile and ProfileMemory):
+            Converted = ConvertImage(filename,Options,CacheDir,CacheSize,Timings,Names)
+            message = CoCo3Compress.ReportText(CoCo3Compress.CompressionReport(Converted[2])) if Options["Compress"]==1 else ""
+            if outdir is not None:
+                with CoCo3Profile.Stage(Timings,"write"):
+                    WriteOutputs(outdir,*Converted)
+                Converted = None
+        return filename,True,message,time.perf_counter()-start,Converted,Timings
+    except Exception as err:
+        return filename,False,str(err),time.perf_counter()-start,None,Timings
+
+"""
+This function takes a list of image files, directories, and glob patterns, and returns the sorted list of image files they refer to.
+Directories are searched (not recursively) for any file that has a file extension PIL knows how to open (not the formats it can only save).
+"""
+def FindImages(Inputs):
+    Image.init()
+    Extensions = set(ext for ext,format in Image.registered_extensions().items() if format in Image.OPEN)
+    filenames = set()
+    for entry in Inputs:
+        if os.path.isdir(entry):
+            for filename in os.listdir(entry):
+                if os.path.splitext(filename)[1].lower() in Extensions:
+                    filenames.add(os.path.join(entry,filename))
+        elif os.path.isfile(entry):
+            filenames.add(entry)
+        else:
+            filenames.update(i for i in glob.glob(entry) if os.path.isfile(i))
+    return sorted(filenames)
+
+"""
+This function converts a list of image files in parallel with a process pool, and prints the success or failure of each file, followed by the
+total throughput. Workers is the number of processes to use (None uses all of the cores). If Tracks is given, the .BIN and .BAS files are not
+written; instead the images are packed in order onto as many Tracks track .DSK images as they need, named DiskName1.DSK, DiskName2.DSK, and
+so on (an image that can't be put on a disk is reported as failed, and no disk is written if there are no images to put on one). If CacheDir is given, the conversion cache in that directory is used, and its hits and misses for this batch are printed at the end.
+If a report filename (Profile) is given, the time of each stage for each image is written to it as JSON or CSV (see CoCo3Profile.WriteReport),
+along with the peak memory of each stage if ProfileMemory is True. Images whose names would clash get unique CoCo names (see UniqueNames), so none of them overwrites another, and the new name is printed.
+It returns the list of 6-tuples from ConvertFile.
+"""
+def ConvertBatch(filenames,outdir,Options,Workers=None,Tracks=None,DiskName="IMAGES",CacheDir=None,CacheSize=CoCo3Cache.DefaultCacheSize,Profile=None,
+                 ProfileMemory=False):
+    os.makedirs(outdir,exist_ok=True)
+    results = []
+    start = time.perf_counter()
+    if CacheDir is not None:
+        StartStats = CoCo3Cache.CacheStats(CacheDir)
+    Names = dict(zip(filenames,UniqueNames(filenames)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=Workers) as executor:
+        futures = [executor.submit(ConvertFile,filename,None if Tracks else outdir,Options,CacheDir,CacheSize,Profile is not None,Names[filename],ProfileMemory) for filename in filenames]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            filename,success,message,seconds,Null,Null = result
+            if success:
+                if Names[filename]!=FileNames(filename): #renamed so it doesn't overwrite another image
+                    message = ("saved as %s.BAS" % Names[filename][0])+(", "+message if message else "")
+                print("OK      %s (%.2fs)%s" % (filename,seconds," "+message if message else ""))
+            else:
+                print("FAILED  %s: %s" % (filename,message))
+            results.append(result)
+    if Tracks:
+        Converted = {i[0]:i for i in results if i[1]}
+        Images = []
+        for filename in filenames:
+            if filename not in Converted:
+                continue
+            try:
+                files = CoCo3Disk.ImageFiles(*Converted[filename][4])
+                for i in files:
+                    CoCo3Disk.DirName(i[0])
+                Images.append(files)
+            except ValueError as err: #UnicodeEncodeError is a ValueError too
+                print("FAILED  %s: %s" % (filename,err))
+                Null,Null,Null,seconds,Null,Timings = Converted[filename]
+                results[results.index(Converted[filename])] = (filename,False,str(err),seconds,None,Timings)
+        if Images:
+            disks = CoCo3Disk.PackDisks(Images,Tracks)
+            for i in range(len(disks)):
+                with open(os.path.join(outdir,DiskName+str(i+1)+".DSK"),'wb') as outfile:
+                    outfile.write(disks[i])
+            print("Wrote %d %d track disk image(s)" % (len(disks),Tracks))
+        else:
+            print("No disk images written, since there were no images to put on them")
+    elapsed = time.perf_counter()-start
+    if CacheDir is not None:
+        Stats = CoCo3Cache.CacheStats(CacheDir)
+        print("Cache: %d hits, %d misses, %d evictions, %.1fMB used" % tuple([Stats[i]-StartStats[i] for i in ["Hits","Misses","Evictions"]]+[Stats["Bytes"]/2**20]))
+    converted = sum(1 for i in results if i[1])
+    print("Converted %d of %d images in %.2fs (%.2f images/s)" % (converted,len(results),elapsed,converted/elapsed if elapsed>0 else 0.0))
+    if Profile is not None:
+        Rows = [CoCo3Profile.ImageRow(i[0],Options["Monitor"],i[5]) for i in sorted(results) if i[1]]
+        CoCo3Profile.WriteReport(Profile,CoCo3Profile.MakeReport(Rows,elapsed))
+        print("Wrote the stage timings to "+Profile)
+    return results
+
+"""
+This function takes the parsed command line arguments, and returns the dictionary of conversion options. The values start from DefaultOptions,
+then the JSON options file (if any) is applied, then any flags given on the command line. The result is checked with CheckOptions.
+"""
+def BatchOptions(args):
+    Options = dict(DefaultOptions)
+    if args.options:
+        with open(args.options) as infile:
+            FileOptions = json.load(infile)
+        if not isinstance(FileOptions,dict):
+            raise ValueError("the options file must hold a JSON object")
+        Options.update(FileOptions)
+    if args.monitor is not None:
+        Options["Monitor"] = args.monitor
+    if args.stretch is not None:
+        Options["Stretch"] = int(args.stretch)
+    if args.hpos is not None:
+        Options["HPos"] = "lcr".index(args.hpos)
+    if args.vpos is not None:
+        Options["VPos"] = "tcb".index(args.vpos)
+    if args.background is not None:
+        Options["BackColor"] = args.background
+    if args.dither is not None:
+        Options["Dither"] = args.dither
+    if args.serpentine is not None:
+        Options["Serpentine"] = int(args.serpentine)
+    if args.mode is not None:
+        Options["Mode"] = args.mode
+    if args.compress is not None:
+        Options["Compress"] = int(args.compress)
+    return CheckOptions(Options)
+
+"""
+The whole number conversion options, and the values each one can have
+"""
+IntOptions = {"Stretch":[0,1],"HPos":[0,1,2],"VPos":[0,1,2],"BackColor":list(range(len(CCNamesRGB))),"Serpentine":[0,1],"Mode":sorted(CCModes),
+              "Compress":[0,1]}
+
+"""
+This function takes a dictionary of conversion options, and returns it with old style values updated, or raises ValueError if any of them
+aren't valid. Every option has to be there, with the right type (true and false are fine for the 0 or 1 options), and nothing else can be.
+"""
+def CheckOptions(Options):
+    Unknown = [i for i in Options if i not in DefaultOptions]
+    if Unknown:
+        raise ValueError("Unknown option(s): "+", ".join(str(i) for i in Unknown))
+    Missing = [i for i in DefaultOptions if i not in Options]
+    if Missing:
+        raise ValueError("Missing option(s): "+", ".join(Missing))
+    if not isinstance(Options["Monitor"],str) or Options["Monitor"][:1].upper() not in CCMonitors:
+        raise ValueError("Monitor must be R(GB) or C(MP)")
+    Options["Monitor"] = Options["Monitor"][0].upper()
+    if isinstance(Options["Dither"],int) and Options["Dither"] in (0,1): #options files from before there were dither modes
+        Options["Dither"] = ["none","pil"][Options["Dither"]]
+    if not isinstance(Options["Dither"],str) or Options["Dither"] not in CoCo3Dither.DitherModes:
+        raise ValueError("Dither must be one of: "+", ".join(CoCo3Dither.DitherModes))
+    for name,values in IntOptions.items():
+        if not isinstance(Options[name],int) or Options[name] not in values:
+            if name=="BackColor":
+                raise ValueError("BackColor must be a CoCo color number from 0 to 63")
+            raise ValueError(name+" must be one of: "+", ".join(str(i) for i in values))
+        Options[name] = int(Options[name]) #true and false become 1 and 0
+    return Options
+
+"""
+This function takes a description, and returns a command line parser with all of the conversion option flags (see BatchOptions)
+"""
+def ConversionParser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--options",help="JSON file with conversion options (keys: "+", ".join(DefaultOptions)+")")
+    parser.add_argument("--monitor",choices=["R","C"],help="(R)GB or (C)MP monitor [default: R]")
+    parser.add_argument("--stretch",action="store_true",default=None,help="stretch the image to fill the screen")
+    parser.add_argument("--no-stretch",dest="stretch",action="store_false",help="keep the image aspect ratio [default]")
+    parser.add_argument("--hpos",choices=["l","c","r"],help="horizontal position if the image is narrower than the screen [default: c]")
+    parser.add_argument("--vpos",choices=["t","c","b"],help="vertical position if the image is shorter than the screen [default: c]")
+    parser.add_argument("--background",type=int,help="CoCo color number (0-63) for the background [default: 0]")
+    parser.add_argument("--dither",choices=CoCo3Dither.DitherModes,help="dither mode [default: pil]")
+    parser.add_argument("--no-dither",dest="dither",action="store_const",const="none",help="don't dither the image (same as --dither none)")
+    parser.add_argument("--serpentine",action="store_true",default=None,help="use a serpentine scan for floyd-steinberg and atkinson dithering")
+    parser.add_argument("--mode",type=int,choices=sorted(CCModes),help="HSCREEN mode: "+", ".join(str(k)+" = "+v[3] for k,v in CCModes.items())+" [default: 2]")
+    parser.add_argument("--compress",action="store_true",default=None,help="write compressed .BIN files, which load faster from disk")
+    return parser
+
+"""
+This function is the argparse type for the number of worker processes. It takes the command line text, and returns it as a whole number, or
+raises argparse.ArgumentTypeError if it isn't 1 or more.
+"""
+def PositiveInt(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("not a whole number: "+text)
+    if value<1:
+        raise argparse.ArgumentTypeError("must be 1 or more: "+text)
+    return value
+
+"""
+This function runs the script in batch mode from the command line arguments (argv)
+"""
+def BatchMain(argv):
+    parser = ConversionParser("Convert images to CoCo 3 HSCREEN .BIN files and a .BAS display program.")
+    parser.add_argument("inputs",nargs="+",help="image files, directories, or glob patterns to convert")
+    parser.add_argument("-o","--outdir",default=".",help="directory to write the .BIN and .BAS files to [default: current directory]")
+    parser.add_argument("-j","--jobs",type=PositiveInt,help="number of worker processes [default: all cores]")
+    parser.add_argument("--dsk",type=int,choices=CoCo3Disk.DiskTracks,help="pack the images onto .DSK images with this many tracks instead of writing .BIN and .BAS files")
+    parser.add_argument("--dsk-name",default="IMAGES",help="base name of the .DSK images [default: IMAGES]")
+    parser.add_argument("--cache",nargs="?",const=CoCo3Cache.DefaultCacheDir,help="reuse conversions from the cache in this directory [default: "+CoCo3Cache.DefaultCacheDir+"]")
+    parser.add_argument("--cache-size",type=float,default=CoCo3Cache.DefaultCacheSize/2**20,help="size limit of the cache in MB [default: %(default)g]")
+    parser.add_argument("--profile",metavar="REPORT",help="write the time of each conversion stage for each image to this .json or .csv file")
+    parser.add_argument("--profile-memory",action="store_true",help="add the peak memory of each stage to the --profile report (much slower)")
+    args = parser.parse_args(argv)
+    if args.profile_memory and not args.profile:
+        parser.error("--profile-memory needs --profile")
+    try:
+        Options = BatchOptions(args)
+    except (OSError,ValueError,KeyError) as err:
+        parser.error(str(err))
+    filenames = FindImages(args.inputs)
+    if not filenames:
+        parser.error("no image files found")
+    results = ConvertBatch(filenames,args.outdir,Options,args.jobs,args.dsk,args.dsk_name,args.cache,int(args.cache_size*2**20),args.profile,args.profile_memory)
+    return 0 if all(i[1] for i in results) else 1
+
+"""
+This function runs the script interactively, asking for all of the input variables with prompts
+"""
+def InteractiveMain():
+    Options = dict(DefaultOptions)
+    """
+    ***************************************************************************************************************
+    These are the input variables for using this script
+    ***************************************************************************************************************
+    """
+    filename=input("""Please provide the filename of the image file.
+Note: 6 characters or less for the base of the name is best: """)
+    while True:
+        Choice = input("Will you be displaying the picture on an (R)GB (recommended) or (C)MP monitor? ")
+        if Choice[0].upper() in CCMonitors:
+            Options["Monitor"] = Choice[0].upper()
+            break
+        else:
+            print("Invalid input!")
+    CCNames,CC_Colors,Null = CCMonitors[Options["Monitor"]]
+    Options["Mode"] = MenuChoice({str(key):(key,value[3]) for key,value in CCModes.items()},"Which HSCREEN mode would you like to use? ")
+    #the menu returns the color number, so the background color can be passed along with the rest of the options
+    ColorNameChoices = {key:(int(key),value[1]) for key,value in ColorChoices(CCNames,CC_Colors).items()}
+    # open the source image to find its aspect ratio
+    (width,height) = OrientedSize(Image.open(filename))
+    ratio = 1.0*height/width
+    #If the image isn't the same aspect ratio as HSCREEN 2, tell the script how to position the image on HSCREEN 2
+    VPosChoices = {"t":(0,"Top"),"c":(1,"Center"),"b":(2,"Bottom")}
+    HPosChoices = {"l":(0,"Left"),"c":(1,"Center"),"r":(2,"Right")}
+    while not(ratio==CCRatio):
+        Choice = input("""The image is not the same aspect ratio as the screen.
+Do you want to strech the image to fill the screen? """)
+        if Choice[0].upper()=="Y":
+            Options["Stretch"] = 1 # If this is 1, the image will be stretched to fill the screen
+            break
+        elif Choice[0].upper()=="N":
+            while True:
+                Choice1 = input("""Do you want to change the background color [default: black]? """)
+                if Choice1[0].upper()=="Y":
+                    #Color used for the background color on the screen if the image doesn't fill the full screen
+                    Options["BackColor"] = MenuChoice(ColorNameChoices,"Select a background color from the list: ")
+                    break
+                elif Choice1[0].upper()=="N":
+                    break
+                else:
+                    print("Invalid input!")
+            if ratio < CCRatio:
+                Options["VPos"] = MenuChoice(VPosChoices,"How would you like to position the image on the screen? ")
+            else:
+                Options["HPos"] = MenuChoice(HPosChoices,"How would you like to position the image on the screen? ")
+            break
+        else:
+            print("Invalid input!")
+    print("""
+Dithering (recommended) interleaves colors from the available palette to approximate other colors.""")
+    Options["Dither"] = MenuChoice(CoCo3Dither.DitherChoices,"How would you like to dither the image? ")
+    while Options["Dither"] in CoCo3Dither.Kernels:
+        Choice = input("""A serpentine scan (every other row right to left) avoids some diagonal patterns, but is slower.
+Do you want to use a serpentine scan? """)
+        if Choice[0].upper()=="Y":
+            Options["Serpentine"] = 1
+            break
+        elif Choice[0].upper()=="N":
+            break
+        else:
+            print("Invalid input!")
+    while True:
+        Choice = input("""Compressed .BIN files load faster from disk, and are unpacked on the CoCo as they load.
+Do you want to compress the .BIN files? """)
+        if Choice[0].upper()=="Y":
+            Options["Compress"] = 1
+            break
+        elif Choice[0].upper()=="N":
+            break
         else:
-            line+='\r'
-        outfile.write(line)
+            print("Invalid input!")
+    """
+    ***************************************************************************************************************
+    """
+    Converted = ConvertImage(filename,Options)
+    WriteOutputs(".",*Converted)
+    if Options["Compress"]==1:
+        print(CoCo3Compress.ReportText(CoCo3Compress.CompressionReport(Converted[2])))
+
+if __name__ == "__main__":
+    if len(sys.argv)>1:
+        sys.exit(BatchMain(sys.argv[1:]))
+    InteractiveMain()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Tests for the animation converter. Run them with:
+    python -m pytest
+The delta records are played back with the python copy of the 6809 player (ApplyDelta), which has to turn each frame into the next one exactly.
+"""
+import os
+import numpy as np
+from PIL import Image
+import CoCo3Anim as CA
+import Image2CoCo3_3 as I2C
+
+ScreenSize = 4*I2C.LImagefileMax
+
+"""
+This function takes a list of delta records, and returns a list of (bank,offset,length) for them, with the length byte read the same way the
+player reads it (0 means 256)
+"""
+def RecordRuns(records):
+    runs = []
+    for record in records:
+        bank,offset,n = record[0],record[1]*256+record[2],record[3] or 256
+        assert len(record)==CA.RecordHead+n
+        runs.append((bank,offset,n))
+    return runs
+
+"""
+This function takes the screen data, and the list of delta records, and returns a copy of the screen data with the records applied
+"""
+def Replay(screen,records):
+    screen = screen.copy()
+    CA.ApplyDelta(screen,b"".join(records)+CA.EndRecord)
+    return screen
+
+def test_delta_round_trip():
+    rng = np.random.default_rng(7)
+    prev = rng.integers(0,256,ScreenSize,dtype=np.uint8)
+    for changes in [0,1,50,5000,ScreenSize]:
+        cur = prev.copy()
+        where = rng.choice(ScreenSize,changes,replace=False)
+        cur[where] = cur[where]^rng.integers(1,256,changes,dtype=np.uint8)
+        records = CA.DeltaRecords(prev,cur)
+        assert (Replay(prev,records)==cur).all(),changes
+        for bank,offset,n in RecordRuns(records):
+            assert 0<=bank<4 and 1<=n<=256 and offset+n<=I2C.LImagefileMax
+        prev = cur
+
+def test_delta_runs():
+    prev = np.zeros(ScreenSize,dtype=np.uint8)
+    cur = prev.copy()
+    cur[I2C.LImagefileMax-2:I2C.LImagefileMax+2] = 1 #across the bank 0/1 boundary
+    cur[3*I2C.LImagefileMax:3*I2C.LImagefileMax+600] = 2 #longer than one record
+    cur[2*I2C.LImagefileMax+100] = cur[2*I2C.LImagefileMax+101+CA.MergeGap] = 3 #MergeGap unchanged bytes apart
+    cur[2*I2C.LImagefileMax+300] = cur[2*I2C.LImagefileMax+302+CA.MergeGap] = 4 #one more than that
+    records = CA.DeltaRecords(prev,cur)
+    assert RecordRuns(records)==[(0,I2C.LImagefileMax-2,2),(1,0,2),(2,100,2+CA.MergeGap),(2,300,1),(2,302+CA.MergeGap,1),(3,0,256),(3,256,256),
+                                 (3,512,88)]
+    assert records[5][3]==0 and records[6][3]==0 #256 is stored as 0
+    assert (Replay(prev,records)==cur).all()
+
+"""
+This function takes a directory, and the number of frames, and saves that many frames of random noise there as numbered PNG files (which
+changes nearly every byte of the screen, so each frame needs several delta files). It returns the list of filenames in number order.
+"""
+def NoiseFrames(path,Count):
+    rng = np.random.default_rng(8)
+    filenames = []
+    for i in range(Count):
+        filenames.append(os.path.join(path,"frame%d.png" % (i+1)))
+        Image.fromarray(rng.integers(0,256,(I2C.CCMaxH,I2C.CCMaxW,3),dtype=np.uint8)).save(filenames[-1])
+    return filenames
+
+def test_convert_animation(tmp_path):
+    Inputs = [str(tmp_path)]
+    NoiseFrames(str(tmp_path),3)
+    outdir = str(tmp_path/"out")
+    Options = dict(I2C.DefaultOptions,Dither="none")
+    Stats = CA.ConvertAnimation(Inputs,outdir,Options,Loop=False)
+    frames = list(CA.PackedFrames(Inputs,Options,CA.ClipPalette(Inputs,Options)))
+    assert Stats["Frames"]==3 and Stats["Parts"]>=4
+    name,truncname = I2C.FileNames(os.path.join(str(tmp_path),"frame1.png"))
+    screen = np.zeros(ScreenSize,dtype=np.uint8)
+    for i in range(4):
+        with open(os.path.join(outdir,truncname+" "+str(i+1)+".BIN"),'rb') as infile:
+            screen[i*I2C.LImagefileMax:(i+1)*I2C.LImagefileMax] = np.frombuffer(infile.read()[5:-5],dtype=np.uint8)
+    assert (screen==frames[0]).all()
+    shown = 1
+    for part in range(1,Stats["Parts"]+1):
+        with open(os.path.join(outdir,name[:4]+"%04d.BIN" % part),'rb') as infile:
+            data = infile.read()
+        assert data[:5]==b"\x00"+(len(data)-10).to_bytes(2,"big")+CA.DeltaAddr.to_bytes(2,"big")
+        assert len(data)-10<=CA.MaxDeltaSize
+        CA.ApplyDelta(screen,data[5:-5])
+        if shown<len(frames) and (screen==frames[shown]).all():
+            shown+=1
+    assert shown==3
+
+def test_too_many_parts(tmp_path,monkeypatch):
+    NoiseFrames(str(tmp_path),2)
+    monkeypatch.setattr(CA,"MaxParts",2)
+    try:
+        CA.ConvertAnimation([str(tmp_path)],str(tmp_path/"out"),dict(I2C.DefaultOptions,Dither="none"))
+    except ValueError as err:
+        assert "more than 2 delta files" in str(err)
+        return
+    assert False
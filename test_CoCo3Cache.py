@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Tests for the conversion cache. Run them with:
+    python -m pytest
+"""
+import os
+import CoCo3Cache as CC
+
+"""
+This function takes the cache directory, and returns the set of keys of the entries in it
+"""
+def CachedKeys(CacheDir):
+    return set(os.path.splitext(filename)[0] for subdir in os.listdir(CacheDir) if os.path.isdir(os.path.join(CacheDir,subdir))
+               for filename in os.listdir(os.path.join(CacheDir,subdir)) if filename.endswith(CC.EntryExt))
+
+"""
+This function takes the cache directory, and returns the total size of the entry files in it
+"""
+def CachedBytes(CacheDir):
+    return sum(os.path.getsize(CC.EntryPath(CacheDir,key)) for key in CachedKeys(CacheDir))
+
+def test_round_trip(tmp_path):
+    CacheDir = str(tmp_path)
+    for n,CCPal in enumerate([list(range(16)),[0,63,18,36],[5,9]]):
+        ImageContent = bytes(range(256))*(n+1)
+        key = CC.CacheKey(ImageContent,{"Mode":n})
+        assert CC.CacheGet(CacheDir,key) is None
+        CC.CachePut(CacheDir,key,ImageContent,CCPal)
+        assert CC.CacheGet(CacheDir,key)==(ImageContent,CCPal)
+    CC.FlushStats(CacheDir)
+    Stats = CC.CacheStats(CacheDir)
+    assert (Stats["Hits"],Stats["Misses"],Stats["Stores"],Stats["Evictions"])==(3,3,3,0)
+    assert Stats["Bytes"]==CachedBytes(CacheDir)
+
+def test_flush_every(tmp_path,monkeypatch):
+    CacheDir = str(tmp_path)
+    monkeypatch.setattr(CC,"FlushEvery",3)
+    CC.CacheGet(CacheDir,"00")
+    CC.CacheGet(CacheDir,"01")
+    assert CC.CacheStats(CacheDir)["Misses"]==0 #still only counted in this process
+    CC.CacheGet(CacheDir,"02")
+    assert CC.CacheStats(CacheDir)["Misses"]==3
+
+def test_evict_oldest(tmp_path):
+    CacheDir = str(tmp_path)
+    EntrySize = 1000
+    MaxBytes = 10*(EntrySize+2)
+    keys = ["%064x" % i for i in range(10)]
+    for i,key in enumerate(keys):
+        CC.CachePut(CacheDir,key,bytes(EntrySize),[i],MaxBytes)
+        os.utime(CC.EntryPath(CacheDir,key),(1000+i,1000+i)) #stored one second apart
+    os.utime(CC.EntryPath(CacheDir,keys[0]),(2000,2000)) #the first one was used last
+    assert CachedKeys(CacheDir)==set(keys) and CC.CacheStats(CacheDir)["Evictions"]==0
+    CC.CachePut(CacheDir,"%064x" % 10,bytes(EntrySize),[10],MaxBytes)
+    Kept = CachedKeys(CacheDir)
+    assert CachedBytes(CacheDir)<=CC.LowWater*MaxBytes
+    assert Kept=={keys[0]}|set(keys[3:])|{"%064x" % 10} #the least recently used ones went first
+    Stats = CC.CacheStats(CacheDir)
+    assert Stats["Evictions"]==2 and Stats["Bytes"]==CachedBytes(CacheDir)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Tests for the .BIN file compression. Run them with:
+    python -m pytest
+Every bank is packed and then unpacked again with the python copy of the 6809 unpacker, which has to give back exactly the same bytes.
+"""
+import numpy as np
+import CoCo3Compress as CC
+
+"""
+This function returns a dictionary of test banks (8kB each): all one byte, random bytes (which don't compress at all), two levels of random
+pixels (like a 2 color dither), and a short repeating pattern (like ordered dithering)
+"""
+def TestBanks():
+    rng = np.random.default_rng(5)
+    return {"flat":bytes([0x55])*CC.BankSize,
+            "random":rng.integers(0,256,CC.BankSize,dtype=np.uint8).tobytes(),
+            "two level":(rng.integers(0,2,CC.BankSize,dtype=np.uint8)*0x11).tobytes(),
+            "periodic":bytes([0x12,0x34,0x56,0x78,0x9A,0xBC,0xDE])*(CC.BankSize//7)+bytes(CC.BankSize%7)}
+
+def test_pack_round_trip():
+    for name,bank in TestBanks().items():
+        assert CC.Unpack(CC.Pack(bank))==bank,name
+
+def test_pack_sizes():
+    Banks = TestBanks()
+    assert len(CC.Pack(Banks["flat"]))<=3*(-(-CC.BankSize//CC.MaxMatch))+2 #one literal, then the longest copies
+    assert len(CC.Pack(Banks["periodic"]))<=3*(-(-CC.BankSize//CC.MaxMatch))+16
+    assert len(CC.Pack(Banks["two level"]))<CC.BankSize
+    assert len(CC.Pack(Banks["random"]))>CC.MaxPackedSize #random bytes only get bigger
+
+def test_bin_files():
+    for name,bank in TestBanks().items():
+        fileImage = CC.PackedBINFile(bank)
+        Segments,Exec = CC.ReadBINFile(fileImage)
+        assert dict(Segments)[CC.UnpackAddr]==CC.UnpackCode
+        if name=="random": #stored as it is, and the EXEC just runs the RTS at the end of the unpacker
+            assert Exec==CC.ReturnAddr and CC.UnpackCode[CC.ReturnAddr-CC.UnpackAddr]==0x39
+            assert dict(Segments)[CC.BankAddr]==bank
+        else:
+            assert Exec==CC.UnpackAddr
+        assert CC.BankData(fileImage)==bank,name
+
+def test_compression_report():
+    Banks = TestBanks()
+    fileImages = [CC.PackedBINFile(Banks[i]) for i in ["flat","random","two level","periodic"]]
+    Report = CC.CompressionReport(fileImages)
+    assert Report["PlainBytes"]==4*(5+CC.BankSize+5)
+    assert Report["PackedBytes"]==sum(len(i) for i in fileImages)
+    assert Report["Ratio"]==Report["PackedBytes"]/Report["PlainBytes"]
+    assert Report["PackedSeconds"]<Report["PlainSeconds"]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Tests for the DECB .DSK writer. Run them with:
+    python -m pytest
+The images are packed onto disks, and every file is read back by following its granules through the FAT, the same way DECB does.
+"""
+import numpy as np
+import CoCo3Disk as CD
+import Image2CoCo3_3 as I2C
+
+"""
+This function takes the number of images, and returns a list of them as lists of files from ImageFiles, each one with its own name and random
+screen data (which doesn't compress, so every HSCREEN 2 image takes the same space). Every third image is compressed, to get files that end
+part way through a sector.
+"""
+def TestImages(Count):
+    rng = np.random.default_rng(6)
+    Images = []
+    for i in range(Count):
+        name = "PIC%d" % i
+        Compress = int(i%3==2)
+        screen = rng.integers(0,256,4*I2C.LImagefileMax,dtype=np.uint8).tobytes()
+        if Compress:
+            screen = bytes(4*I2C.LImagefileMax//2)+screen[:4*I2C.LImagefileMax//2]
+        fileImages = I2C.MakeBINFiles(screen,Compress)
+        Images.append(CD.ImageFiles(name,name,fileImages,I2C.MakeBASProgram(name,list(range(16)),"R",2,Compress)))
+    return Images
+
+"""
+This function takes a disk image and a filename on it, and returns the FAT bytes of the granules the file uses, in order
+"""
+def GranuleChain(disk,filename):
+    fat = CD.FAT(disk)
+    granule = [i[3] for i in CD.ListFiles(disk) if i[0]==filename][0]
+    chain = [fat[granule]]
+    while chain[-1]<0xC0:
+        granule = chain[-1]
+        chain.append(fat[granule])
+    return chain
+
+def test_pack_round_trip():
+    for Tracks in CD.DiskTracks:
+        Images = TestImages(10)
+        disks = CD.PackDisks(Images,Tracks)
+        Stored = {}
+        for disk in disks:
+            assert len(disk)==Tracks*CD.SectorsPerTrack*CD.SectorSize
+            for filename,FileType,ASCII,Null,Null in CD.ListFiles(disk):
+                Stored[filename] = (CD.ReadFile(disk,filename),FileType,ASCII,GranuleChain(disk,filename))
+        Files = [i for files in Images for i in files]
+        assert sorted(Stored)==sorted(i[0] for i in Files)
+        for filename,data,FileType,ASCII in Files:
+            assert Stored[filename][:3]==(data,FileType,ASCII),filename
+            chain = Stored[filename][3]
+            assert len(chain)==CD.GranulesNeeded(len(data))
+            assert chain[-1]==0xC0+-(-(len(data)-(len(chain)-1)*CD.GranuleSize)//CD.SectorSize),filename
+
+def test_disk_rollover():
+    for Tracks,PerDisk in [(35,4),(40,4),(80,9)]:
+        Images = [TestImages(1)[0] for i in range(2*PerDisk+1)]
+        Images = [[(i[0].replace("PIC0","P%d" % n),)+i[1:] for i in files] for n,files in enumerate(Images)]
+        disks = CD.PackDisks(Images,Tracks)
+        assert [len(CD.ListFiles(i))//5 for i in disks]==[PerDisk,PerDisk,1]
+        assert CD.ListFiles(disks[1])[0][0]=="P%d.BAS" % PerDisk
+    assert len(CD.PackDisks([],35))==1 and CD.ListFiles(CD.PackDisks([],35)[0])==[]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Tests for the conversion server. Run them with:
+    python -m pytest
+The server runs in a thread on a free port, with one worker process and no queue, so a request that kept its slot would make the next one busy.
+"""
+import http.client
+import io
+import json
+import threading
+from PIL import Image
+import CoCo3Server as CS
+
+"""
+This function takes the server, the path, the request body and the Content-Length to send (the real length if None), and returns a 2-tuple of
+the HTTP status and the JSON answer
+"""
+def Post(server,path,body,length=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2],timeout=60)
+    connection.putrequest("POST",path)
+    connection.putheader("Content-Length",str(len(body) if length is None else length))
+    connection.endheaders(body)
+    response = connection.getresponse()
+    status,answer = response.status,response.read()
+    connection.close()
+    return status,json.loads(answer) if answer.startswith(b"{") else answer
+
+def test_server():
+    server = CS.MakeServer(Port=0,Workers=1,MaxQueue=0,MaxUpload=1<<20)
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    try:
+        image = io.BytesIO()
+        Image.new("RGB",(64,48),(255,0,0)).save(image,"PNG")
+        assert Post(server,"/convert",b"",-1)[0]==400
+        assert Post(server,"/convert",b"",2<<20)[0]==413
+        assert Post(server,"/convert?Mode=9",image.getvalue())[0]==400
+        assert Post(server,"/convert",b"not an image")[0]==400
+        status,answer = Post(server,"/convert?name=caf%C3%A9.png&Mode=1",image.getvalue())
+        assert status==200 and answer["name"]=="CAFE" and len(answer["bin"])==2
+        Metrics = CS.Metrics(server)
+        assert Metrics["in_flight"]==0 and Metrics["rejected"]==0 and Metrics["completed"]==1
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.executor.shutdown()
+
+def test_bad_input():
+    assert CS.BadInput(ValueError()) and CS.BadInput(OSError("cannot identify image file"))
+    assert not CS.BadInput(KeyError("Monitor")) and not CS.BadInput(OSError(28,"No space left on device"))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+@author: marcsulf
+
+Tests for the CoCo 3 image converter. Run them with:
+    python -m pytest
+The HSCREEN 2 encoder is checked byte for byte against the way the script used to do it: saving the palettized image as a BMP file, reading
+it back, flipping the rows, and packing the pixels two to a byte.
+"""
+import io
+import os
+import struct
+import numpy as np
+from PIL import Image
+import Image2CoCo3_3 as I2C
+
+"""
+This function is the old HSCREEN 2 encoder, kept here to check the new one against. It takes a palettized PIL image, and the list of (R,G,B)
+triplets for the CoCo colors (CC_Colors), saves the image as a BMP file in memory, and returns a 2-tuple of the screen data (with the 2KB of
+TailColor pixels on the end) and the list of CoCo color numbers for the 16 palette slots, just like the script did before.
+"""
+def LegacyEncode(imagep,CC_Colors):
+    outfile = io.BytesIO()
+    imagep.save(outfile,"BMP")
+    fileContent = outfile.getvalue()
+    Null,Null,Null,DataStart,HeaderSize,W,H,Null,bpp = struct.unpack("<2s6I2H",fileContent[:struct.calcsize("<2s6I2H")])
+    assert bpp==8
+    ImageContent = b""
+    for row in range(H): #BMP rows run bottom to top
+        A = fileContent[DataStart+row*W:DataStart+(row+1)*W]
+        ImageContent = bytes((A[i]<<4)+A[i+1] for i in range(0,W,2))+ImageContent
+    ImageContent += bytes([I2C.TailColor+(I2C.TailColor<<4)])*2048
+    Palette = fileContent[14+HeaderSize:DataStart]+bytes(4*16) #B,G,R and a zero byte for each color, padded with black like the old palette
+    CCPal = []
+    for k in range(16):
+        B,G,R = Palette[4*k:4*k+3]
+        dists = [(R-c[0])**2+(G-c[1])**2+(B-c[2])**2 for c in CC_Colors]
+        CCPal.append(dists.index(min(dists)))
+    return ImageContent,CCPal
+
+"""
+This function returns a fixed 320x192 palettized test image that uses the 16 CoCo colors in CCPal: random pixels on the top half, and stripes
+of every slot on the bottom half, so every nibble value shows up in both halves of a byte
+"""
+def TestImage(CC_Colors,CCPal):
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0,16,(I2C.CCMaxH,I2C.CCMaxW),dtype=np.uint8)
+    pixels[I2C.CCMaxH//2:] = (np.arange(I2C.CCMaxW)//3%16)[None,:]
+    imagep = Image.fromarray(pixels,"P")
+    imagep.putpalette([k for i in CCPal for k in CC_Colors[i]])
+    return imagep
+
+def test_encode_matches_bmp_round_trip():
+    for Monitor in I2C.CCMonitors:
+        CC_Colors = I2C.CCMonitors[Monitor][1]
+        CCPal = [0,5,9,12,18,27,30,36,40,45,50,54,58,60,62,63] #no color that is a copy of an earlier one, as SelectPalette never picks those
+        imagep = TestImage(CC_Colors,CCPal)
+        ImageContent,EncodedPal = I2C.EncodeScreen(imagep,CC_Colors)
+        Golden,GoldenPal = LegacyEncode(imagep,CC_Colors)
+        assert len(ImageContent)==4*I2C.LImagefileMax
+        assert ImageContent==Golden
+        assert EncodedPal==GoldenPal
+        assert I2C.EncodeScreen(imagep,CC_Colors,2,CCPal)==(Golden,GoldenPal) #the palette slots passed along from QuantizeImage
+
+def test_bin_files_match_old_layout():
+    CC_Colors = I2C.CCMonitors["R"][1]
+    Golden,Null = LegacyEncode(TestImage(CC_Colors,list(range(16))),CC_Colors)
+    fileImages = I2C.MakeBINFiles(Golden)
+    assert len(fileImages)==4
+    for i in range(4):
+        assert fileImages[i]==b"\x00\x20\x00\x60\x00"+Golden[i*8192:(i+1)*8192]+b"\xff\x00\x00\x00\x00"
+
+def test_unique_names():
+    Names = I2C.UniqueNames(["a/photo_001.png","b/photo_002.jpg","photo2.png","other.png"])
+    assert Names[0]==("PHOTO_00","PHOTO_")
+    assert len(set(i[0] for i in Names))==4 and len(set(i[1] for i in Names))==4
+    assert all(len(i[0])<=8 and len(i[1])<=6 for i in Names)
+    assert Names[3]==("OTHER","OTHER")
+    Names = I2C.UniqueNames(["café.png","cafe.png",'my "pic".v2.png',"日本.png",".png"])
+    assert Names[:2]==[("CAFE","CAFE"),("CAFE2","CAFE2")]
+    assert Names[2]==("MY__PIC_","MY__PI") and Names[4]==("IMAGE","IMAGE")
+    assert all(set(i[0]+i[1])<=I2C.DECBChars for i in Names)
+
+def test_find_images(tmp_path):
+    for filename in ["a.png","b.JPG","c.pdf","d.txt"]:
+        (tmp_path/filename).write_bytes(b"")
+    assert [os.path.basename(i) for i in I2C.FindImages([str(tmp_path)])]==["a.png","b.JPG"]
+    for jobs in ["0","-2","x"]:
+        try:
+            I2C.BatchMain([str(tmp_path),"-j",jobs])
+        except SystemExit as err:
+            assert err.code==2
+            continue
+        assert False,jobs
+
+def test_check_options():
+    assert I2C.CheckOptions(dict(I2C.DefaultOptions,Monitor="cmp",Dither=1,Stretch=True))["Monitor"]=="C"
+    for bad in [{"BackColor":"5"},{"BackColor":64},{"HPos":3},{"VPos":-1},{"Stretch":2},{"Serpentine":1.0},{"Compress":None},{"Mode":5},
+                {"Monitor":5},{"Dither":"fast"},{"Foo":1}]:
+        try:
+            I2C.CheckOptions(dict(I2C.DefaultOptions,**bad))
+        except ValueError:
+            continue
+        assert False,bad
+
+def test_open_image_too_thin():
+    for size,word in [((3000,2),"short"),((2,3000),"narrow")]:
+        data = io.BytesIO()
+        Image.new("RGB",size).save(data,"PNG")
+        try:
+            I2C.OpenImage(data.getvalue())
+        except ValueError as err:
+            assert word in str(err)
+            continue
+        assert False,size
+
+def test_pack_pixels_order():
+    assert I2C.PackPixels(np.array([[1,0,1,1,0,0,1,0,0,0,0,0,0,0,0,1]]),1).tobytes()==bytes([0b10110010,0b00000001])
+    assert I2C.PackPixels(np.array([[3,0,2,1,0,1,2,3]]),2).tobytes()==bytes([0b11001001,0b00011011])
+    assert I2C.PackPixels(np.array([[0xA,0x5]]),4).tobytes()==bytes([0xA5])
+
+def test_encode_modes():
+    CC_Colors = I2C.CCMonitors["R"][1]
+    for Mode,Banks,Tail in [(1,2,1024),(2,4,2048),(3,2,1024),(4,4,2048)]:
+        Width,Height,Bits,Null = I2C.CCModes[Mode]
+        assert I2C.ModeBanks(Mode)==Banks
+        pixels = np.random.default_rng(Mode).integers(0,1<<Bits,(Height,Width),dtype=np.uint8)
+        pixels[-1,-1] = 1 #so the last byte of the screen isn't the same as the tail
+        imagep = Image.fromarray(pixels,"P")
+        imagep.putpalette([0]*768)
+        ImageContent,CCPal = I2C.EncodeScreen(imagep,CC_Colors,Mode,[63,18])
+        assert len(ImageContent)==Banks*I2C.LImagefileMax and CCPal==[63,18]+[0]*((1<<Bits)-2)
+        assert ImageContent[-Tail:]==bytes(Tail) and ImageContent[-Tail-1]!=0
+        assert ImageContent[:Width*Bits//8]==I2C.PackPixels(pixels[:1],Bits).tobytes() #the top row comes first
+        assert len(I2C.MakeBINFiles(ImageContent))==Banks
+
+def test_mode_line():
+    for Mode,Banks,Slots in [(1,2,3),(2,4,15),(3,2,1),(4,4,3)]:
+        BASText = I2C.MakeBASProgram("PIC",list(range(16)),"R",Mode)
+        assert "40 FOR H=1TO%d'LOOP THROUGH %d IMAGE FILES\r" % (Banks,Banks) in BASText
+        assert "120 FOR S=0TO%d'LOOP THROUGH PALETTE SLOTS\r" % Slots in BASText
+        assert "160 HSCREEN %d'DISPLAY THE IMAGE\r" % Mode in BASText
+        assert "180 DATA "+str(list(range(Slots+1)))[1:-1]+"\r" in BASText